@@ -50,6 +50,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
@@ -68,6 +69,7 @@ AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'commerce.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,6 +80,9 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# log duplicate queries and @query_budget overruns (commerce.middleware)
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=DEBUG, cast=bool)
+
 ROOT_URLCONF = 'FurniCraft.urls'
 
 CACHES = {
@@ -148,6 +153,11 @@ cloudinary.config(
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
 PURCHASE_QTY_LIMIT = config("PURCHASE_QTY_LIMIT", default=5, cast=int)
+# how long checkout holds stock for an unpaid Razorpay order
+STOCK_HOLD_MINUTES = config("STOCK_HOLD_MINUTES", default=15, cast=int)
+# sales append to the StockMovement ledger and are admitted by redis
+# counters instead of locking the variant row (see commerce.services.inventory)
+INVENTORY_LEDGER = config("INVENTORY_LEDGER", default=False, cast=bool)
 
 
 DATABASES = {
@@ -163,6 +173,14 @@ DATABASES = {
 
 RAZORPAY_KEY_ID = config("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = config("RAZORPAY_KEY_SECRET")
+# "fake" swaps in commerce.services.payments.FakeGateway (tests, local runs)
+PAYMENT_GATEWAY = config("PAYMENT_GATEWAY", default="razorpay")
+# (connect, read) seconds per gateway call, and retries of calls that never reached it
+PAYMENT_GATEWAY_TIMEOUT = (
+    config("PAYMENT_GATEWAY_CONNECT_TIMEOUT", default=3.05, cast=float),
+    config("PAYMENT_GATEWAY_READ_TIMEOUT", default=10, cast=float),
+)
+PAYMENT_GATEWAY_RETRIES = config("PAYMENT_GATEWAY_RETRIES", default=2, cast=int)
 
 SECURE_CROSS_ORIGIN_OPENER_POLICY = 'same-origin-allow-popups'
 
@@ -19,8 +19,9 @@ from django.core.exceptions import ValidationError
 from django.contrib import messages
 from django.utils.timezone import now
 from django.core.paginator import Paginator
-from django.db.models import Q,Prefetch
-from cloudinary.utils import cloudinary_url
+from django.db.models import Q
+from commerce.utils.search import search_products,ranked_search
+from commerce.utils.image_urls import get_renditions_many,rendition_url,warm_primary_images,invalidate_image_urls
 from django.db.models.functions import TruncMonth, TruncYear,ExtractWeek
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Count,Sum,F
@@ -43,6 +44,8 @@ from product.forms import CategoryForm,ProductForm,ProductVariantForm,ProductOff
 from commerce.utils.orders import is_first_successful_order
 from commerce.utils.referral import process_referral_after_first_order 
 from commerce.services.returns import approve_return_service
+from commerce.services.inventory import record_adjustment,restock
+from commerce.services.order_assembly import line_quantities
 from .services.order_status import update_order_payment_status,update_order_item_status
 
 logger = logging.getLogger("admin_app")
@@ -305,7 +308,11 @@ def customer_list(request):
     customers = User.objects.all().order_by('-created_at')
 
     if search_query:
-        customers = customers.filter(Q(first_name__icontains=search_query)|Q(last_name__icontains=search_query))
+        customers = ranked_search(
+            customers, search_query,
+            ["first_name", "last_name", "email"],
+            trigram_fields=["first_name", "last_name"],
+        )
 
     if filter_status == 'blocked':
         customers = customers.filter(is_blocked=True)
@@ -357,18 +364,11 @@ def admin_category_list(request):
     querystring = params.urlencode()
 
 
+    get_renditions_many(cat.image for cat in page_obj)
     primary_images = {}
     for cat in page_obj:
         if cat.image:
-            url , _= cloudinary_url(
-                cat.image,
-                width=100,
-                height=100,
-                crop='fill',
-                gravity='auto',
-                secure=True
-            )
-            primary_images[cat.id]=url
+            primary_images[cat.id]=rendition_url(cat.image,"thumb")
 
     context = {
         'page_obj': page_obj,
@@ -412,13 +412,7 @@ def edit_category(request,id):
         form=CategoryForm(instance=category)
 
     if category.image:
-        category_image_url, _ = cloudinary_url(
-        category.image,
-        width=300,
-        height=300,
-        crop="fill",
-        secure=True
-    )
+        category_image_url = rendition_url(category.image,"card")
     else:
         category_image_url = None
         
@@ -454,12 +448,10 @@ def admin_product_list(request):
     search_query = request.GET.get('q', '').strip()
 
     
-    products = Product.objects.all_with_deleted().prefetch_related(
-        Prefetch('images', queryset=ProductImage.objects.order_by('-is_primary', '-created_at'))
-    ).order_by('is_deleted','-created_at')
+    products = Product.objects.all_with_deleted().select_related('primary_image').order_by('is_deleted','-created_at')
 
     if search_query:
-        products = products.filter(Q(name__icontains=search_query))
+        products = search_products(products, search_query)
 
 
     paginator = Paginator(products, 9)
@@ -473,11 +465,12 @@ def admin_product_list(request):
 
 
 
+    warm_primary_images(page_obj)
     primary_images = {}
     for product in page_obj:
-        primary_image = product.images.filter(is_primary=True).first() or product.images.first()
-        if primary_image and hasattr(primary_image.image, 'url'):
-            primary_images[product.id] = primary_image.image.url
+        primary_image = product.primary_image
+        if primary_image and primary_image.image:
+            primary_images[product.id] = rendition_url(primary_image.image,"thumb")
         else:
             primary_images[product.id] = None
 
@@ -557,7 +550,9 @@ def edit_product(request, id):
 
             
             for removed_url in old_urls - new_urls:
-                ProductImage.objects.filter(product=product, image__contains=removed_url).delete()
+                removed = ProductImage.objects.filter(product=product, image__contains=removed_url)
+                invalidate_image_urls(*[img.image for img in removed])
+                removed.delete()
 
             
             for added_url in new_urls - old_urls:
@@ -660,6 +655,7 @@ def add_variant(request, product_id):
             variant = form.save(commit=False)
             variant.product = product  
             variant.save()
+            record_adjustment(variant.id, variant.stock)
             messages.success(request, "Variant added successfully.")
             return redirect('admin_variant_list', product_id=product.id)
     else:
@@ -676,9 +672,11 @@ def edit_variant(request, id):
     product = variant.product  
 
     if request.method == 'POST':
+        old_stock = variant.stock
         form = ProductVariantForm(request.POST, instance=variant,show_deleted=True)
         if form.is_valid():
             form.save()
+            record_adjustment(variant.id, variant.stock - old_stock)
             messages.success(request, "Variant updated successfully.")
             return redirect('admin_variant_list', product_id=product.id)
     else:
@@ -716,7 +714,15 @@ def admin_order_list(request):
     orders=Orders.objects.select_related("user","address").order_by("-created_at")
 
     if search_query:
-        orders = orders.filter(order_id__icontains=search_query)
+        # order ids are matched literally, customer names/emails through search
+        by_customer = ranked_search(
+            orders, search_query,
+            ["user__first_name", "user__last_name", "user__email"],
+            trigram_fields=["user__first_name", "user__last_name"],
+        )
+        orders = orders.filter(
+            Q(order_id__icontains=search_query) | Q(pk__in=by_customer.values("pk"))
+        )
 
     paginator = Paginator(orders, 12)  
     page_number = request.GET.get("page")
@@ -1319,14 +1325,15 @@ def admin_cancel_order(request, order_id):
         else:
             # For COD or Failed payments
             order.payment_status = "cancelled"        
+        restocked = []
         for item in cancellable_items.select_for_update():
             
             item.status = "cancelled"
             item.cancellation_reason = reason
             item.save(update_fields=['status', 'cancellation_reason'])
+            restocked.append((item.product_id, item.quantity))
 
-            item.product.stock += item.quantity
-            item.product.save(update_fields=['stock'])
+        restock(line_quantities(restocked), "cancel", order)
 
         order.total_price = Decimal("0.00")
         order.save(update_fields=['payment_status', 'total_price'])
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db import connection
+from commerce.utils.query_budget import QueryRecorder
+
+
+class QueryBudgetMiddleware:
+    """
+    Records every query of a request (QUERY_BUDGET_ENABLED, on with DEBUG)
+    and logs duplicates, N+1-looking repeats and views that go over their
+    @query_budget.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, "QUERY_BUDGET_ENABLED", False):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        recorder.report(request.path, getattr(request, "_query_budget", None))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, "query_budget", None)
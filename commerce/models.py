@@ -186,6 +186,33 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"Order {self.order.order_id} - {self.product}"
     
+class StockReservation(models.Model):
+    """
+    Stock held for a Razorpay order between checkout and payment. Active
+    holds count against available-to-sell until they are committed (paid),
+    released (failed) or expire.
+    """
+    STATUS_CHOICES=[
+        ('active','Active'),
+        ('committed','Committed'),
+        ('released','Released'),
+    ]
+    order=models.ForeignKey(Orders,related_name='reservations',on_delete=models.CASCADE)
+    variant=models.ForeignKey("product.ProductVariant",related_name='reservations',on_delete=models.CASCADE)
+    quantity=models.PositiveIntegerField()
+    status=models.CharField(max_length=20,choices=STATUS_CHOICES,default='active')
+    expires_at=models.DateTimeField()
+    created_at=models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes=[
+            models.Index(fields=['variant','expires_at'],condition=models.Q(status='active'),name='reservation_active_idx'),
+            models.Index(fields=['expires_at'],condition=models.Q(status='active'),name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant_id} for {self.order_id} ({self.status})"
+
 class OrderReturn(models.Model):
     RETURN_CHOICES=[
         ('defective_product','Defective Product'),
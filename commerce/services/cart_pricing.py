@@ -0,0 +1,80 @@
+from decimal import Decimal
+from commerce.models import Cart
+from commerce.utils.pricing import get_pricing_contexts
+
+FREE_SHIPPING_THRESHOLD = Decimal("1000")
+SHIPPING_CHARGE = Decimal("80")
+MAX_COD_AMOUNT = Decimal("1000")
+
+
+class CartPricing:
+    """
+    Prices a whole cart in a fixed number of queries: the cart items with
+    variant/product/category joined, plus the active offers (served from
+    the offer cache). Each item gets `pricing`, `offer_percent`,
+    `discounted_price` and `line_total` attached, like product.pricing on
+    listing pages.
+
+    Use CartPricing.for_request() from views; it memoizes the result on the
+    request, keyed on the cart's updated_at, so helpers that run in the same
+    request reuse it.
+    """
+
+    def __init__(self, cart, items=None):
+        self.cart = cart
+        if items is None:
+            items = cart.items.select_related("variant__product__category", "product__primary_image")
+        self.items = list(items)
+
+        pricing_map = get_pricing_contexts(item.variant for item in self.items)
+
+        self.subtotal = Decimal("0")
+        self.offer_discount = Decimal("0")
+        self.item_count = 0
+
+        for item in self.items:
+            pricing = pricing_map[item.variant_id]
+            price = Decimal(item.variant.sales_price)
+
+            item.pricing = pricing
+            item.offer_percent = pricing["offer_percent"]
+            item.discounted_price = pricing["current_price"]
+            item.line_total = item.discounted_price * item.quantity
+
+            self.subtotal += item.line_total
+            self.offer_discount += (price - item.discounted_price) * item.quantity
+            self.item_count += item.quantity
+
+    @property
+    def key(self):
+        return (self.cart.pk, self.cart.updated_at)
+
+    @property
+    def is_empty(self):
+        return not self.items
+
+    @property
+    def shipping_cost(self):
+        # an empty cart shows no shipping; checkout never sees one
+        if self.is_empty:
+            return Decimal("0")
+        return Decimal("0") if self.subtotal >= FREE_SHIPPING_THRESHOLD else SHIPPING_CHARGE
+
+    def total(self, coupon_discount=Decimal("0")):
+        return self.subtotal - coupon_discount + self.shipping_cost
+
+    def cod_allowed(self, coupon_discount=Decimal("0")):
+        return self.total(coupon_discount) <= MAX_COD_AMOUNT
+
+    @classmethod
+    def for_request(cls, request, cart=None):
+        if cart is None:
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+
+        memo = getattr(request, "_cart_pricing", None)
+        if memo is not None and memo.key == (cart.pk, cart.updated_at):
+            return memo
+
+        pricing = cls(cart)
+        request._cart_pricing = pricing
+        return pricing
@@ -0,0 +1,230 @@
+import heapq
+import logging
+from array import array
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from commerce.models import OrderItem, Orders
+from product.models import (
+    CoPurchaseNeighbours,
+    CoPurchasePair,
+    CoPurchaseState,
+    ProductVariant,
+    VariantCoPurchaseNeighbours,
+    VariantCoPurchasePair,
+)
+
+logger = logging.getLogger("commerce")
+
+TOP_N = 20
+BATCH_SIZE = 500
+OPEN_STATUSES = ("order_received", "shipped", "in_transit")
+# orders with items still in progress are waited on for this long, then
+# folded in with whatever was delivered
+SETTLE_AFTER = timedelta(days=30)
+# a Razorpay order still unpaid after this is abandoned: its items stay
+# order_received for good, so it is skipped instead of waited on
+UNPAID_STATUSES = ("pending", "failed", "cancelled")
+ABANDON_AFTER = timedelta(days=1)
+
+# a pair (a, b), a < b, is packed into one int64 so a batch is a flat array
+_SHIFT = 32
+_MASK = (1 << _SHIFT) - 1
+
+# the two matrices: (key field, pair model, neighbours model); a basket is
+# a (product ids, variant ids) tuple, indexed in the same order
+LEVELS = (
+    ("product", CoPurchasePair, CoPurchaseNeighbours),
+    ("variant", VariantCoPurchasePair, VariantCoPurchaseNeighbours),
+)
+
+
+def _count_pairs(baskets):
+    """{(a, b): orders containing both} for a batch of baskets (sets of ids)."""
+    keys = array("q")
+    for basket in baskets:
+        keys.extend(a << _SHIFT | b for a, b in combinations(sorted(basket), 2))
+    return {(key >> _SHIFT, key & _MASK): n for key, n in Counter(keys).items()}
+
+
+def _abandoned(payment_method, payment_status, created_at, now):
+    return (
+        payment_method == "razorpay"
+        and payment_status in UNPAID_STATUSES
+        and created_at <= now - ABANDON_AFTER
+    )
+
+
+def _next_batch(after_id, batch_size, cutoff, now):
+    """
+    Baskets of delivered (product ids, variant ids) for the orders after
+    `after_id`, the id to resume from, and whether the job should stop.
+    Stops at the first recent order that still has items in progress, so
+    it is picked up again once delivered; abandoned Razorpay orders are
+    skipped.
+    """
+    orders = list(
+        Orders.objects.filter(id__gt=after_id).order_by("id")
+        .values_list("id", "created_at", "payment_method", "payment_status")[:batch_size]
+    )
+    if not orders:
+        return [], after_id, True
+
+    items = defaultdict(list)
+    for order_id, status, variant_id, product_id in OrderItem.objects.filter(
+        order_id__in=[order[0] for order in orders]
+    ).values_list("order_id", "status", "product_id", "product__product_id"):
+        items[order_id].append((status, variant_id, product_id))
+
+    baskets = []
+    last_id = after_id
+    for order_id, created_at, payment_method, payment_status in orders:
+        if _abandoned(payment_method, payment_status, created_at, now):
+            last_id = order_id
+            continue
+        rows = items.get(order_id, [])
+        if created_at > cutoff and any(status in OPEN_STATUSES for status, _, _ in rows):
+            return baskets, last_id, True
+        delivered = [(variant_id, product_id) for status, variant_id, product_id in rows if status == "delivered"]
+        variants = {variant_id for variant_id, _ in delivered}
+        if len(variants) > 1:
+            baskets.append(({product_id for _, product_id in delivered}, variants))
+        last_id = order_id
+
+    return baskets, last_id, len(orders) < batch_size
+
+
+def _add_pair_counts(level, pairs):
+    """Adds a batch's pair counts onto the level's pair model; returns the ids involved."""
+    field, pair_model, _ = level
+    firsts = {a for a, _ in pairs}
+    seconds = {b for _, b in pairs}
+    existing = pair_model.objects.filter(
+        **{f"{field}_a_id__in": firsts, f"{field}_b_id__in": seconds}
+    ).values_list(f"{field}_a_id", f"{field}_b_id", "count")
+    for a, b, count in existing:
+        if (a, b) in pairs:
+            pairs[(a, b)] += count
+
+    pair_model.objects.bulk_create(
+        [pair_model(**{f"{field}_a_id": a, f"{field}_b_id": b}, count=n) for (a, b), n in pairs.items()],
+        update_conflicts=True,
+        unique_fields=[f"{field}_a", f"{field}_b"],
+        update_fields=["count"],
+        batch_size=1000,
+    )
+    return firsts | seconds
+
+
+def _rebuild_neighbours(level, ids, top_n):
+    field, pair_model, neighbours_model = level
+    ranked = defaultdict(list)
+    rows = pair_model.objects.filter(
+        Q(**{f"{field}_a_id__in": ids}) | Q(**{f"{field}_b_id__in": ids})
+    ).values_list(f"{field}_a_id", f"{field}_b_id", "count")
+    for a, b, count in rows:
+        if a in ids:
+            ranked[a].append((count, b))
+        if b in ids:
+            ranked[b].append((count, a))
+
+    entries = []
+    for key in ids:
+        top = heapq.nlargest(top_n, ranked[key])
+        entries.append(neighbours_model(
+            **{f"{field}_id": key},
+            neighbour_ids=[other for _, other in top],
+            counts=[count for count, _ in top],
+        ))
+    neighbours_model.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=[field],
+        update_fields=["neighbour_ids", "counts", "updated_at"],
+        batch_size=500,
+    )
+
+
+def update_co_purchase_index(batch_size=BATCH_SIZE, top_n=TOP_N, rebuild=False):
+    """
+    Folds delivered orders placed since the last run into the product and
+    variant co-purchase matrices and refreshes the top-N neighbours of
+    every product and variant they touch. Each batch commits together with
+    the new last_order_id, so an interrupted run resumes where it stopped.
+    rebuild=True starts over from the first order.
+
+    Returns the number of orders processed.
+    """
+    with transaction.atomic():
+        if rebuild:
+            for _, pair_model, neighbours_model in LEVELS:
+                pair_model.objects.all().delete()
+                neighbours_model.objects.all().delete()
+            CoPurchaseState.objects.all().delete()
+        state, _ = CoPurchaseState.objects.get_or_create(pk=1)
+
+    now = timezone.now()
+    cutoff = now - SETTLE_AFTER
+    start_id = state.last_order_id
+    done = False
+    while not done:
+        baskets, last_id, done = _next_batch(state.last_order_id, batch_size, cutoff, now)
+        if last_id == state.last_order_id:
+            break
+        with transaction.atomic():
+            for index, level in enumerate(LEVELS):
+                pairs = _count_pairs(basket[index] for basket in baskets)
+                if pairs:
+                    _rebuild_neighbours(level, _add_pair_counts(level, pairs), top_n)
+            state.last_order_id = last_id
+            state.save(update_fields=["last_order_id", "updated_at"])
+
+    processed = Orders.objects.filter(id__gt=start_id, id__lte=state.last_order_id).count()
+    logger.info(
+        "Co-purchase index updated",
+        extra={"orders": processed, "last_order_id": state.last_order_id},
+    )
+    return processed
+
+
+def _neighbour_totals(neighbours_model, field, ids):
+    totals = Counter()
+    for neighbour_ids, counts in neighbours_model.objects.filter(
+        **{f"{field}_id__in": ids}
+    ).values_list("neighbour_ids", "counts"):
+        for other, count in zip(neighbour_ids, counts):
+            totals[other] += count
+    return totals
+
+
+def bought_together(product_ids, limit, exclude=()):
+    """
+    Ids of the products most often bought with any of `product_ids`,
+    summed over their stored neighbour lists (one pk lookup per call).
+    """
+    product_ids = list(product_ids)
+    totals = _neighbour_totals(CoPurchaseNeighbours, "product", product_ids)
+    skip = set(product_ids) | set(exclude)
+    return [other for other, _ in totals.most_common() if other not in skip][:limit]
+
+
+def variants_bought_together(variant_ids, limit, exclude=()):
+    """
+    Ids of the products whose variants were most often bought with any of
+    `variant_ids`, e.g. a cart: the teak chair's buyers may want other
+    things than the pine chair's. Two queries.
+    """
+    totals = _neighbour_totals(VariantCoPurchaseNeighbours, "variant", list(variant_ids))
+    if not totals:
+        return []
+    product_of = dict(ProductVariant.objects.filter(id__in=totals).values_list("id", "product_id"))
+    by_product = Counter()
+    for variant_id, count in totals.items():
+        if variant_id in product_of:
+            by_product[product_of[variant_id]] += count
+
+    skip = set(exclude)
+    return [other for other, _ in by_product.most_common() if other not in skip][:limit]
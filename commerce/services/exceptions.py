@@ -1,2 +1,18 @@
 class InsufficientWalletBalance(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class InsufficientStock(Exception):
+    def __init__(self, variant_id, available):
+        self.variant_id = variant_id
+        self.available = available
+        super().__init__(f"Only {available} left for variant {variant_id}")
+
+
+class PaymentGatewayError(Exception):
+    """The gateway could not be reached or rejected the call."""
+    pass
+
+
+class InvalidPaymentSignature(Exception):
+    pass
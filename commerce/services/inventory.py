@@ -0,0 +1,246 @@
+"""
+Every stock change goes through here and is written to the StockMovement
+ledger.
+
+By default (classic mode) ProductVariant.stock is updated in the same
+statement and the movement is stored already compacted. With
+INVENTORY_LEDGER on, checkout no longer locks or updates the variant row:
+units are admitted by an atomic redis counter per variant, the sale is
+appended as a pending movement, and compact_stock() (the compact_stock
+command) periodically folds pending movements into ProductVariant.stock.
+Until then pages read snapshot + pending: attach_live_stock for loaded
+variants (one extra query per page), pending_stock() inside querysets.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from product.models import ProductVariant, StockMovement
+from .exceptions import InsufficientStock
+from .order_assembly import check_stock, decrement_stock, lock_variants
+
+ADMIT_KEY = "inventory:admit:{}"
+
+
+def ledger_mode():
+    return getattr(settings, "INVENTORY_LEDGER", False)
+
+
+def pending_stock():
+    """
+    Subquery: the variant's (OuterRef("pk")) movements not yet compacted.
+    Always 0 in classic mode, where every movement is stored compacted.
+    """
+    return Coalesce(Subquery(
+        StockMovement.objects.filter(variant=OuterRef("pk"), compacted=False)
+        .order_by()
+        .values("variant")
+        .annotate(total=Sum("delta"))
+        .values("total")
+    ), 0)
+
+
+def attach_live_stock(variants):
+    """
+    Ledger mode: adds each variant's pending movements to its in-memory
+    .stock (one query), so pages show what compaction will write. For
+    display only, never save these instances. Classic mode: no-op.
+    """
+    if not ledger_mode():
+        return
+    variants = list(variants)
+    pending = dict(
+        StockMovement.objects.filter(variant_id__in=[v.id for v in variants], compacted=False)
+        .order_by()
+        .values("variant_id")
+        .annotate(total=Sum("delta"))
+        .values_list("variant_id", "total")
+    )
+    for v in variants:
+        v.stock += pending.get(v.id, 0)
+
+
+def _record(quantities, reason, order=None, sign=1):
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            variant_id=variant_id,
+            delta=sign * quantity,
+            reason=reason,
+            order=order,
+            compacted=not ledger_mode(),
+        )
+        for variant_id, quantity in quantities.items()
+    ])
+
+
+# --- redis admission counters (ledger mode) ---
+
+def _admit_key(variant_id):
+    """Seeds the counter from the DB (stock + pending - active holds) on first use."""
+    from .reservations import available_to_sell
+
+    key = ADMIT_KEY.format(variant_id)
+    if cache.get(key) is None:
+        cache.add(key, available_to_sell([variant_id]).get(variant_id, 0), timeout=None)
+    return key
+
+
+def admit(quantities):
+    """
+    Takes units from the admission counters, all or nothing. Raises
+    InsufficientStock and puts back what it took when a variant runs
+    out. A transaction that rolls back after this leaves the counter low,
+    never high; `compact_stock --reseed` realigns it.
+    """
+    taken = []
+    for variant_id, quantity in sorted(quantities.items()):
+        key = _admit_key(variant_id)
+        left = cache.decr(key, quantity)
+        taken.append((key, quantity))
+        if left < 0:
+            for k, n in taken:
+                cache.incr(k, n)
+            raise InsufficientStock(variant_id, left + quantity)
+
+
+def give_back(quantities):
+    """Returns units to (or, for negative quantities, takes them from) the admission counters on commit."""
+    def incr():
+        for variant_id, quantity in quantities.items():
+            try:
+                cache.incr(ADMIT_KEY.format(variant_id), quantity)
+            except ValueError:
+                pass  # not seeded yet; seeded from the DB on next use
+
+    if ledger_mode():
+        transaction.on_commit(incr)
+
+
+# --- stock changes ---
+
+def check_available(quantities, user):
+    """
+    Raises InsufficientStock for the first line available_to_sell can't
+    cover, not counting the shopper's own holds. No locks: the checkout
+    page's check, and check_checkout's in ledger mode.
+    """
+    from .reservations import available_to_sell
+
+    available = available_to_sell(quantities, exclude_user=user)
+    for variant_id, quantity in sorted(quantities.items()):
+        if quantity > available.get(variant_id, 0):
+            raise InsufficientStock(variant_id, available.get(variant_id, 0))
+
+
+def check_checkout(quantities, user):
+    """
+    place_order's stock check, raising InsufficientStock. Classic: lock
+    the variants in id order and check stock minus other shoppers' holds
+    (the shopper's own are released before the order is written), the
+    figure check_available reads. Ledger: check_available without locks;
+    take_units() is the real gate.
+    """
+    from .reservations import held_quantities
+
+    if ledger_mode():
+        check_available(quantities, user)
+        return
+
+    variants = lock_variants(quantities)
+    check_stock(quantities, variants, held_quantities(quantities, exclude_user=user))
+
+
+def take_units(quantities, reuse=None):
+    """
+    Ledger mode: takes the units from the admission counters, right
+    before the order is written. `reuse` are units the shopper's own
+    released holds had already taken (release_user_holds, renew_hold);
+    they cover the order first and any surplus is given back. Classic
+    mode: nothing to do, the variant rows are already locked.
+    """
+    if not ledger_mode():
+        return
+    reuse = reuse or {}
+    admit({v: q - reuse.get(v, 0) for v, q in quantities.items() if q > reuse.get(v, 0)})
+    give_back({v: r - quantities.get(v, 0) for v, r in reuse.items() if r > quantities.get(v, 0)})
+
+
+def sell(quantities, order, admitted=True):
+    """
+    Records a sale. Classic: one guarded UPDATE (decrement_stock). Ledger:
+    pending movements only; pass admitted=False when the units were not
+    taken from the counters (e.g. a Razorpay hold that was released).
+    """
+    if ledger_mode():
+        if not admitted:
+            admit(quantities)
+    else:
+        decrement_stock(quantities)
+    _record(quantities, "sale", order=order, sign=-1)
+
+
+def restock(quantities, reason, order=None):
+    """Puts units back (cancel, return)."""
+    if not quantities:
+        return
+    if not ledger_mode():
+        delta = Case(
+            *[When(id=variant_id, then=Value(quantity)) for variant_id, quantity in quantities.items()],
+            output_field=IntegerField(),
+        )
+        ProductVariant.objects.all_with_deleted().filter(id__in=quantities.keys()).update(stock=F("stock") + delta)
+    _record(quantities, reason, order=order)
+    give_back(quantities)
+
+
+def record_adjustment(variant_id, delta):
+    """
+    An admin edit already wrote the new snapshot; the ledger keeps the
+    difference and the admission counter moves with it.
+    """
+    if not delta:
+        return
+    StockMovement.objects.create(variant_id=variant_id, delta=delta, reason="admin_adjust", compacted=True)
+    give_back({variant_id: delta})
+
+
+# --- compaction ---
+
+def compact_stock(batch_size=5000):
+    """
+    Folds pending movements into ProductVariant.stock, oldest first, one
+    batch per transaction. Only this job takes the variant row locks.
+    Returns the number of movements compacted.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockMovement.objects.select_for_update(skip_locked=True)
+                .filter(compacted=False)
+                .order_by("id")
+                .values_list("id", "variant_id", "delta")[:batch_size]
+            )
+            if not rows:
+                return total
+
+            deltas = defaultdict(int)
+            for _, variant_id, delta in rows:
+                deltas[variant_id] += delta
+            lock_variants(deltas)
+            case = Case(
+                *[When(id=variant_id, then=Value(delta)) for variant_id, delta in deltas.items()],
+                output_field=IntegerField(),
+            )
+            ProductVariant.objects.all_with_deleted().filter(id__in=deltas.keys()).update(stock=F("stock") + case)
+            StockMovement.objects.filter(id__in=[row[0] for row in rows]).update(compacted=True)
+        total += len(rows)
+
+
+def reseed_counters(variant_ids=None):
+    """Drops admission counters so they are re-seeded from the DB on next use."""
+    if variant_ids is None:
+        variant_ids = ProductVariant.objects.values_list("id", flat=True)
+    cache.delete_many([ADMIT_KEY.format(variant_id) for variant_id in variant_ids])
@@ -0,0 +1,81 @@
+from collections import Counter
+from decimal import Decimal
+from django.db.models import Case, F, IntegerField, Value, When
+from commerce.models import OrderItem
+from product.models import ProductVariant
+from .exceptions import InsufficientStock
+
+
+def line_quantities(lines):
+    """{variant_id: total quantity} from (variant_id, quantity) pairs."""
+    quantities = Counter()
+    for variant_id, quantity in lines:
+        quantities[variant_id] += quantity
+    return dict(quantities)
+
+
+def lock_variants(variant_ids):
+    """
+    Locks the live variants in one SELECT ... FOR UPDATE ORDER BY id, so
+    two checkouts sharing variants always lock them in the same order.
+    Returns {variant_id: variant}.
+    """
+    return {
+        v.id: v
+        for v in ProductVariant.objects.select_for_update().filter(id__in=set(variant_ids)).order_by("id")
+    }
+
+
+def check_stock(quantities, variants, held=None):
+    """
+    Raises InsufficientStock for the first line the locked stock can't
+    cover. `held` is {variant_id: quantity} reserved for other orders.
+    """
+    held = held or {}
+    for variant_id, quantity in sorted(quantities.items()):
+        variant = variants.get(variant_id)
+        available = variant.stock - held.get(variant_id, 0) if variant else 0
+        if quantity > available:
+            raise InsufficientStock(variant_id, available)
+
+
+def create_order_items(order, items):
+    """One INSERT for every line of a priced cart (see CartPricing)."""
+    return OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product_id=item.variant_id,
+            quantity=item.quantity,
+            unit_price=Decimal(item.variant.sales_price),
+            price=item.line_total,
+            offer_percent=item.offer_percent,
+        )
+        for item in items
+    ])
+
+
+def decrement_stock(quantities):
+    """
+    UPDATE ... SET stock = stock - CASE id WHEN ... END for every variant
+    at once, guarded by stock >= quantity in the same statement. Raises
+    InsufficientStock (leaving the rows to the transaction rollback) if
+    any variant could not be decremented.
+    """
+    if not quantities:
+        return 0
+    delta = Case(
+        *[When(id=variant_id, then=Value(quantity)) for variant_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = (
+        ProductVariant.objects.filter(id__in=quantities.keys(), stock__gte=delta)
+        .update(stock=F("stock") - delta)
+    )
+    if updated != len(quantities):
+        stock = dict(ProductVariant.objects.filter(id__in=quantities.keys()).values_list("id", "stock"))
+        short = next(
+            (variant_id for variant_id, quantity in sorted(quantities.items()) if stock.get(variant_id, 0) < quantity),
+            None,
+        )
+        raise InsufficientStock(short, stock.get(short, 0))
+    return updated
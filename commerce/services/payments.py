@@ -0,0 +1,179 @@
+"""
+Payment gateway adapter. Views talk to get_gateway() instead of building
+a razorpay.Client per request.
+
+The real gateway shares one requests session per process: pooled
+keep-alive connections, a (connect, read) timeout on every call
+(PAYMENT_GATEWAY_TIMEOUT) and urllib3 retries with backoff. Only calls
+that never reached Razorpay are retried, plus GETs on a read error or a
+502/503/504, so an order is never created or a payment captured twice.
+Every failure surfaces as PaymentGatewayError.
+
+PAYMENT_GATEWAY="fake" swaps in FakeGateway, which keeps orders and
+payments in memory and signs callbacks the way Razorpay does.
+"""
+import functools
+import hashlib
+import hmac
+import logging
+import uuid
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .exceptions import InvalidPaymentSignature, PaymentGatewayError
+
+logger = logging.getLogger("commerce")
+
+POOL_SIZE = 10
+BACKOFF_FACTOR = 0.3
+
+_GATEWAY_ERRORS = (
+    requests.RequestException,
+    ValueError,  # an error page that is not JSON
+    razorpay.errors.BadRequestError,
+    razorpay.errors.GatewayError,
+    razorpay.errors.ServerError,
+)
+
+
+def _paise(amount):
+    return int(amount * 100)
+
+
+def payment_signature(order_id, payment_id, key_secret):
+    """Razorpay's checkout signature: HMAC-SHA256 of "order_id|payment_id"."""
+    return hmac.new(key_secret.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+
+
+class _TimeoutSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", settings.PAYMENT_GATEWAY_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def _http_session():
+    retries = settings.PAYMENT_GATEWAY_RETRIES
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        other=0,
+        allowed_methods=frozenset({"GET"}),
+        status_forcelist=(502, 503, 504),
+        backoff_factor=BACKOFF_FACTOR,
+        raise_on_status=False,
+    )
+    session = _TimeoutSession()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry))
+    return session
+
+
+class RazorpayGateway:
+    def __init__(self, key_id, key_secret, session=None):
+        self.client = razorpay.Client(session=session or _http_session(), auth=(key_id, key_secret))
+
+    def _call(self, name, func, *args):
+        try:
+            return func(*args)
+        except _GATEWAY_ERRORS as e:
+            logger.warning("Payment gateway call failed", extra={"call": name, "error": str(e)})
+            raise PaymentGatewayError(str(e)) from e
+
+    def create_order(self, amount, currency="INR"):
+        """Amounts are in rupees; the gateway gets paise."""
+        return self._call("order.create", self.client.order.create, {
+            "amount": _paise(amount),
+            "currency": currency,
+            "payment_capture": 1,
+        })
+
+    def fetch_payment(self, payment_id):
+        return self._call("payment.fetch", self.client.payment.fetch, payment_id, {})
+
+    def capture_payment(self, payment_id, amount):
+        return self._call("payment.capture", self.client.payment.capture, payment_id, _paise(amount), {})
+
+    def refund_payment(self, payment_id, amount):
+        return self._call("payment.refund", self.client.payment.refund, payment_id, _paise(amount), {})
+
+    def verify_signature(self, order_id, payment_id, signature):
+        """Local HMAC check, no network. Raises InvalidPaymentSignature."""
+        try:
+            self.client.utility.verify_payment_signature({
+                "razorpay_order_id": order_id,
+                "razorpay_payment_id": payment_id,
+                "razorpay_signature": signature,
+            })
+        except razorpay.errors.SignatureVerificationError as e:
+            raise InvalidPaymentSignature() from e
+
+
+class FakeGateway:
+    """
+    In-memory gateway for tests and local runs. pay() plays the customer:
+    it records an authorized payment and returns the payload the checkout
+    JS posts to razorpay_success.
+    """
+
+    def __init__(self, key_secret="fake-secret"):
+        self.key_secret = key_secret
+        self.orders = {}
+        self.payments = {}
+        self.calls = []
+
+    def create_order(self, amount, currency="INR"):
+        self.calls.append("order.create")
+        order = {"id": f"order_{uuid.uuid4().hex[:14]}", "amount": _paise(amount), "currency": currency, "status": "created"}
+        self.orders[order["id"]] = order
+        return dict(order)
+
+    def pay(self, order_id, status="authorized"):
+        order = self.orders[order_id]
+        payment = {"id": f"pay_{uuid.uuid4().hex[:14]}", "order_id": order_id, "amount": order["amount"], "status": status}
+        self.payments[payment["id"]] = payment
+        order["status"] = "attempted"
+        return {
+            "razorpay_order_id": order_id,
+            "razorpay_payment_id": payment["id"],
+            "razorpay_signature": payment_signature(order_id, payment["id"], self.key_secret),
+        }
+
+    def fetch_payment(self, payment_id):
+        self.calls.append("payment.fetch")
+        if payment_id not in self.payments:
+            raise PaymentGatewayError(f"No payment {payment_id}")
+        return dict(self.payments[payment_id])
+
+    def capture_payment(self, payment_id, amount):
+        self.calls.append("payment.capture")
+        payment = self.payments.get(payment_id)
+        if payment is None or payment["status"] != "authorized" or payment["amount"] != _paise(amount):
+            raise PaymentGatewayError(f"Cannot capture {payment_id}")
+        payment["status"] = "captured"
+        self.orders[payment["order_id"]]["status"] = "paid"
+        return dict(payment)
+
+    def refund_payment(self, payment_id, amount):
+        self.calls.append("payment.refund")
+        payment = self.payments.get(payment_id)
+        if payment is None or payment["status"] != "captured" or payment["amount"] < _paise(amount):
+            raise PaymentGatewayError(f"Cannot refund {payment_id}")
+        payment["status"] = "refunded"
+        return dict(payment)
+
+    def verify_signature(self, order_id, payment_id, signature):
+        expected = payment_signature(order_id, payment_id, self.key_secret)
+        if not hmac.compare_digest(expected, signature or ""):
+            raise InvalidPaymentSignature()
+
+
+@functools.lru_cache(maxsize=None)
+def get_gateway():
+    """The process-wide gateway; tests that change PAYMENT_GATEWAY call get_gateway.cache_clear()."""
+    if settings.PAYMENT_GATEWAY == "fake":
+        return FakeGateway()
+    return RazorpayGateway(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
+
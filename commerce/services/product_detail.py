@@ -0,0 +1,100 @@
+import hashlib
+from django.db.models import F, Prefetch
+from commerce.utils.offer_cache import get_active_offer_snapshot, get_offer_generation
+from commerce.utils.pricing import get_pricing_contexts
+from commerce.utils.wishlist_ids import get_wishlist_ids
+from product.models import Product, ProductImage, ProductVariant
+from .inventory import attach_live_stock, ledger_mode, pending_stock
+
+LOW_STOCK_THRESHOLD = 5
+
+
+def stock_band(stock):
+    if stock < 1:
+        return "out_of_stock"
+    if stock <= LOW_STOCK_THRESHOLD:
+        return "low_stock"
+    return "in_stock"
+
+
+def variant_payload(variant, pricing):
+    """What the detail page needs to switch to a variant, JSON-serializable with DjangoJSONEncoder."""
+    return {
+        "material": variant.material_type,
+        "price": pricing["current_price"],
+        "base_price": pricing["base_price"],
+        "offer_percent": pricing["offer_percent"],
+        "stock_band": stock_band(variant.stock),
+    }
+
+
+def variants_etag(product_id):
+    """
+    Version of a product's variant payloads without pricing them: the
+    price columns, stock band and materialized effective price of each
+    live variant, plus the offer generation and the end of the current
+    offer snapshot (so an offer starting or ending on schedule changes
+    it). One small query.
+    """
+    variants = ProductVariant.objects.filter(product_id=product_id)
+    if ledger_mode():
+        variants = variants.annotate(live_stock=F("stock") + pending_stock())
+    rows = variants.values_list(
+        "id", "material_type", "sales_price", "effective_price", "effective_offer_percent",
+        "live_stock" if ledger_mode() else "stock",
+    )
+    parts = [get_offer_generation(), get_active_offer_snapshot()["valid_until"].isoformat()]
+    parts.extend((*row[:-1], stock_band(row[-1])) for row in rows)
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class ProductDetail:
+    """
+    Everything product_details shows about one product, loaded in a fixed
+    number of queries: the product with category and rating summary, its
+    images and variants, the active offers (from the offer cache) and the
+    user's wishlisted variant ids (from the wishlist id set). Each variant gets `pricing`
+    and `in_wishlist` attached; variant_data() is the blob the page embeds
+    so switching material needs no request.
+    """
+
+    def __init__(self, product, wishlist_ids=()):
+        self.product = product
+        self.variants = list(product.variants.all())
+        attach_live_stock(self.variants)
+        self.default_variant = self.variants[0] if self.variants else None
+
+        pricing_map = get_pricing_contexts(self.variants)
+        wishlist_ids = set(wishlist_ids)
+        for v in self.variants:
+            v.pricing = pricing_map[v.id]
+            v.in_wishlist = v.id in wishlist_ids
+
+    @classmethod
+    def load(cls, product_id, user=None):
+        """Raises Product.DoesNotExist for missing or soft-deleted products."""
+        product = Product.objects.select_related("category", "rating_summary").prefetch_related(
+            Prefetch("images", queryset=ProductImage.objects.order_by("-is_primary", "id")),
+            Prefetch("variants", queryset=ProductVariant.objects.select_related("product__category")),
+        ).get(id=product_id)
+
+        wishlist_ids = get_wishlist_ids(user.id) if user is not None else ()
+        return cls(product, wishlist_ids)
+
+    @property
+    def pricing(self):
+        return self.default_variant.pricing if self.default_variant else None
+
+    @property
+    def is_in_wishlist(self):
+        return bool(self.default_variant and self.default_variant.in_wishlist)
+
+    @property
+    def wishlist_variant_ids(self):
+        return [v.id for v in self.variants if v.in_wishlist]
+
+    def variant_data(self):
+        return {
+            v.id: {**variant_payload(v, v.pricing), "in_wishlist": v.in_wishlist}
+            for v in self.variants
+        }
@@ -0,0 +1,154 @@
+import heapq
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
+from commerce.utils.image_urls import warm_primary_images
+from commerce.utils.pricing import attach_best_pricing_to_products
+from product.models import CoPurchaseNeighbours, Product, ProductVariant, RelatedProduct
+from .co_purchase import bought_together, variants_bought_together
+
+logger = logging.getLogger("product")
+
+# rows kept per product / cards shown on product_details
+RELATED_K = 8
+RELATED_SHOWN = 4
+
+CATEGORY_WEIGHT = 1.0
+MATERIAL_WEIGHT = 0.5
+CO_PURCHASE_WEIGHT = 2.0
+
+
+def _listable_products():
+    return Product.objects.filter(
+        Exists(ProductVariant.objects.filter(product=OuterRef("pk"))),
+        category__is_deleted=False,
+    )
+
+
+def _co_purchase_counts():
+    """{product_id: {other_product_id: orders containing both}} from the co-purchase index."""
+    return {
+        product_id: dict(zip(neighbour_ids, counts))
+        for product_id, neighbour_ids, counts in CoPurchaseNeighbours.objects.values_list(
+            "product_id", "neighbour_ids", "counts"
+        )
+    }
+
+
+def _score(pid, other, categories, materials, bought_with, top_co):
+    score = 0.0
+    if categories[pid] == categories[other]:
+        score += CATEGORY_WEIGHT
+    mine, theirs = materials.get(pid), materials.get(other)
+    if mine and theirs:
+        score += MATERIAL_WEIGHT * len(mine & theirs) / len(mine | theirs)
+    if top_co:
+        score += CO_PURCHASE_WEIGHT * bought_with.get(other, 0) / top_co
+    return score
+
+
+def refresh_related_products(product_ids=None, k=RELATED_K):
+    """
+    Rebuilds the top-k RelatedProduct rows for the given products (all
+    listable products by default). Candidates are the same-category
+    products plus the product's co-purchase neighbours (see
+    update_co_purchase_index); the score mixes category match, material
+    overlap (Jaccard) and co-purchase count normalised to the product's
+    strongest pair.
+    """
+    categories = dict(_listable_products().values_list("id", "category_id"))
+
+    materials = defaultdict(set)
+    for pid, material in ProductVariant.objects.filter(product_id__in=categories).values_list(
+        "product_id", "material_type"
+    ):
+        materials[pid].add(material.strip().lower())
+
+    by_category = defaultdict(list)
+    for pid, category_id in categories.items():
+        by_category[category_id].append(pid)
+
+    co_purchase = _co_purchase_counts()
+
+    targets = categories.keys() if product_ids is None else [p for p in product_ids if p in categories]
+    rows = []
+    for pid in targets:
+        bought_with = co_purchase.get(pid, {})
+        candidates = set(by_category[categories[pid]]) | {p for p in bought_with if p in categories}
+        candidates.discard(pid)
+        top_co = max(bought_with.values(), default=0)
+
+        scored = (
+            (_score(pid, other, categories, materials, bought_with, top_co), other)
+            for other in candidates
+        )
+        for rank, (score, other) in enumerate(heapq.nlargest(k, scored)):
+            rows.append(RelatedProduct(product_id=pid, related_id=other, score=score, rank=rank))
+
+    stale = RelatedProduct.objects.all()
+    if product_ids is not None:
+        stale = stale.filter(product_id__in=product_ids)
+    with transaction.atomic():
+        stale.delete()
+        RelatedProduct.objects.bulk_create(rows, batch_size=1000)
+
+    logger.info("Related products refreshed", extra={"products": len(targets), "rows": len(rows)})
+    return len(rows)
+
+
+def get_related_products(product, k=RELATED_SHOWN):
+    """
+    At most k priced products to show next to `product`: the precomputed
+    ranking when there is one, else the newest products in its category.
+    """
+    related_ids = list(
+        RelatedProduct.objects.filter(product=product, rank__lt=k)
+        .order_by("rank")
+        .values_list("related_id", flat=True)
+    )
+    if not related_ids:
+        related_ids = list(
+            _listable_products()
+            .filter(category_id=product.category_id)
+            .exclude(id=product.id)
+            .order_by("-created_at")
+            .values_list("id", flat=True)[:k]
+        )
+    return _load_cards(related_ids)
+
+
+def get_also_bought(product_ids, k=RELATED_SHOWN, exclude=()):
+    """At most k priced products most often bought together with `product_ids`."""
+    return _load_cards(bought_together(product_ids, k, exclude=exclude))
+
+
+def get_also_bought_for_cart(items, k=RELATED_SHOWN):
+    """
+    At most k priced products bought together with the cart's `items`
+    (anything with product_id and variant_id): ranked by the exact
+    variants first, then filled from the product-level pairs.
+    """
+    product_ids = {item.product_id for item in items}
+    ranked = variants_bought_together([item.variant_id for item in items], k, exclude=product_ids)
+    if len(ranked) < k:
+        ranked += bought_together(product_ids, k - len(ranked), exclude=ranked)
+    return _load_cards(ranked)
+
+
+def _load_cards(product_ids):
+    """Listable products for `product_ids`, in that order, priced for cards."""
+    if not product_ids:
+        return []
+    products = {
+        p.id: p
+        for p in _listable_products().filter(id__in=product_ids)
+        .select_related("primary_image")
+        .prefetch_related(
+            Prefetch("variants", queryset=ProductVariant.objects.select_related("product__category"))
+        )
+    }
+    cards = [products[pid] for pid in product_ids if pid in products]
+    attach_best_pricing_to_products(cards)
+    warm_primary_images(cards)
+    return cards
@@ -0,0 +1,125 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from commerce.models import StockReservation
+from product.models import ProductVariant
+from .inventory import give_back, ledger_mode, pending_stock, take_units
+from .order_assembly import check_stock, line_quantities, lock_variants
+
+
+def active_holds(now=None):
+    return StockReservation.objects.filter(status="active", expires_at__gt=now or timezone.now())
+
+
+def held_quantities(variant_ids, exclude_order=None, exclude_user=None):
+    """{variant_id: quantity under active holds}, optionally ignoring one order's or user's own holds."""
+    holds = active_holds().filter(variant_id__in=variant_ids)
+    if exclude_order is not None:
+        holds = holds.exclude(order=exclude_order)
+    if exclude_user is not None:
+        holds = holds.exclude(order__user=exclude_user)
+    return dict(holds.order_by().values("variant_id").annotate(total=Sum("quantity")).values_list("variant_id", "total"))
+
+
+def available_to_sell(variant_ids, exclude_user=None):
+    """
+    {variant_id: stock + pending ledger movements - active holds} for
+    live variants, in one query.
+    Cart views pass the shopper as exclude_user so their own unpaid
+    order doesn't take stock away from their cart.
+    """
+    held = active_holds().filter(variant=OuterRef("pk"))
+    if exclude_user is not None:
+        held = held.exclude(order__user=exclude_user)
+    held = (
+        held
+        .order_by()
+        .values("variant")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    rows = ProductVariant.objects.filter(id__in=variant_ids).annotate(
+        available=F("stock") + pending_stock() - Coalesce(Subquery(held), 0)
+    ).values_list("id", "available")
+    return {variant_id: max(0, available) for variant_id, available in rows}
+
+
+def _expiry():
+    return timezone.now() + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+
+
+def hold_stock(order, quantities):
+    """
+    Creates the order's holds. The caller has checked the stock (and, in
+    ledger mode, taken the units) as place_order does.
+    """
+    expires_at = _expiry()
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, variant_id=variant_id, quantity=quantity, expires_at=expires_at)
+        for variant_id, quantity in quantities.items()
+    ])
+
+
+def renew_hold(order):
+    """
+    Makes sure an unpaid order holds its stock for another hold period:
+    live holds are extended, otherwise (expired, or released by a failed
+    payment) the stock is re-checked (ledger mode: re-admitted, reusing
+    the units its lapsed holds still take from the counters). Raises
+    InsufficientStock. Run inside transaction.atomic().
+    """
+    now = timezone.now()
+    if active_holds(now).filter(order=order).update(expires_at=_expiry()):
+        return
+
+    quantities = line_quantities(order.items.values_list("product_id", "quantity"))
+    released = _release_for_reuse(order.reservations.filter(status="active"))
+    if ledger_mode():
+        take_units(quantities, reuse=released)
+    else:
+        variants = lock_variants(quantities)
+        check_stock(quantities, variants, held_quantities(quantities, exclude_order=order))
+    hold_stock(order, quantities)
+
+
+def commit_holds(order):
+    """The order is paid and its stock decremented; its holds stop counting."""
+    return order.reservations.filter(status="active").update(status="committed")
+
+
+def _release(holds):
+    holds = list(holds.values_list("id", "variant_id", "quantity"))
+    if not holds:
+        return 0
+    StockReservation.objects.filter(id__in=[h[0] for h in holds]).update(status="released")
+    give_back(line_quantities((variant_id, quantity) for _, variant_id, quantity in holds))
+    return len(holds)
+
+
+def _release_for_reuse(holds):
+    """
+    Marks the holds released and returns their {variant_id: quantity} for
+    take_units to reuse; nothing is given back to the counters here.
+    """
+    quantities = line_quantities(holds.values_list("variant_id", "quantity"))
+    holds.update(status="released")
+    return quantities
+
+
+def release_user_holds(user):
+    """
+    A new checkout supersedes the shopper's unpaid Razorpay orders: their
+    holds stop counting, and their units go to the new order first.
+    """
+    return _release_for_reuse(StockReservation.objects.filter(status="active", order__user=user))
+
+
+def release_holds(order):
+    return _release(order.reservations.filter(status="active"))
+
+
+def release_expired_holds(now=None):
+    """Marks expired holds released; run by the release_stock_holds command."""
+    return _release(StockReservation.objects.filter(status="active", expires_at__lte=now or timezone.now()))
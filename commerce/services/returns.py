@@ -1,9 +1,10 @@
 from django.db import transaction
 from decimal import Decimal
-from django.db.models import F,Sum
+from django.db.models import Sum
 
 from commerce.models import OrderReturn, OrderItem, Orders,Wallet, WalletTransaction
 from commerce.utils.coupons import calculate_item_coupon_share
+from .inventory import restock
 
 @transaction.atomic
 def process_refund_to_wallet(order, amount, source):
@@ -55,8 +56,7 @@ def approve_return_service(return_request: OrderReturn):
     return_request.approval_status = "approved"
     item.status = "returned"
     
-    item.product.stock = F('stock') + item.quantity
-    item.product.save(update_fields=["stock"])
+    restock({item.product_id: item.quantity}, "return", order)
     potential_refund =Decimal('0.00')
     if order.payment_status in ["paid", "partially_refunded"]:
         coupon_share = calculate_item_coupon_share(order, item)
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from commerce.models import Cart, CartItem
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart(sender, instance, **kwargs):
+    # Cart.updated_at versions the cart contents (checkout guard, CartPricing memo).
+    # One primary-key UPDATE per item saved or deleted; bulk clears pay it per row.
+    Cart.objects.filter(pk=instance.cart_id).update(updated_at=timezone.now())
@@ -1,19 +1,52 @@
 from django import template
+from commerce.utils.image_urls import rendition_url
 
 register = template.Library()
 
+@register.filter
+def primary_image(product):
+    """
+    Returns the product's cover image from the denormalized
+    Product.primary_image pointer. select_related('primary_image') (or the
+    matching path from cart/order items) makes this query-free.
+    Falls back to prefetched images for products without a pointer yet.
+    """
+    if product is None:
+        return None
+    if product.primary_image_id:
+        return product.primary_image
+
+    prefetched = getattr(product, "_prefetched_objects_cache", {}).get("images")
+    if prefetched is not None:
+        return get_primary_image(prefetched)
+    return None
+
+
 @register.filter
 def get_primary_image(image_queryset):
     """
     Returns the first image object in the queryset where is_primary=True.
     Falls back to the first image if no primary is found.
+    Works from the prefetch cache when the images were prefetched.
     """
     try:
-        # Attempt to get the image where is_primary is True
-        return image_queryset.get(is_primary=True)
-    except image_queryset.model.DoesNotExist:
-        # If no primary image exists, return the first one available
-        return image_queryset.first()
-    except:
-        # Handle cases where the queryset is empty or other errors
-        return None
\ No newline at end of file
+        images = list(image_queryset)
+    except TypeError:
+        return None
+
+    for image in images:
+        if image.is_primary:
+            return image
+    return images[0] if images else None
+
+
+@register.filter
+def rendition(image, name):
+    """{{ img.image|rendition:"card" }} -> cached Cloudinary URL for a named rendition."""
+    return rendition_url(image, name)
+
+
+@register.filter
+def srcset(image, name):
+    """{{ img.image|srcset:"card" }} -> matching srcset string."""
+    return rendition_url(image, name + "_srcset")
@@ -1,3 +1,633 @@
-from django.test import TestCase
+import json
+import random
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from commerce.models import Cart, CartItem, OrderItem, Orders, Wallet
+from commerce.services.exceptions import InsufficientStock
+from commerce.services import co_purchase
+from commerce.services.inventory import ADMIT_KEY, take_units
+from commerce.services.payments import get_gateway
+from commerce.services.reservations import (
+    available_to_sell,
+    hold_stock,
+    release_expired_holds,
+    release_holds,
+    renew_hold,
+)
+from commerce.utils import idempotency
+from commerce.utils.discounts import compute_discount, compute_discounts, discount_expression
+from commerce.utils.offer_cache import bump_offer_generation, get_active_offer_snapshot, get_offer_generation
+from commerce.utils.pricing import get_pricing_context, get_pricing_contexts
+from commerce.utils.idempotency import idempotent
+from product.models import (
+    Category,
+    CategoryOffer,
+    CoPurchaseNeighbours,
+    CoPurchasePair,
+    CoPurchaseState,
+    Product,
+    ProductOffer,
+    ProductVariant,
+    VariantCoPurchaseNeighbours,
+    VariantCoPurchasePair,
+)
+from users.models import User, UserAddress
 
-# Create your tests here.
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ShopTestCase(TestCase):
+    """A shopper with an address and one variant in stock."""
+
+    stock = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="shopper@example.com", password="pass", first_name="Test", last_name="Shopper"
+        )
+        cls.address = UserAddress.objects.create(
+            user=cls.user, house="12", district="Ernakulam", pincode=682001, state="Kerala"
+        )
+        Wallet.objects.create(user=cls.user)
+        cls.category = Category.objects.create(name="Tables", image="categories/tables.jpg")
+        cls.product = Product.objects.create(name="Oak table", category=cls.category)
+        cls.variant = ProductVariant.objects.create(
+            product=cls.product,
+            material_type="Oak",
+            regular_price=Decimal("5000.00"),
+            sales_price=Decimal("4000.00"),
+            description="Oak dining table",
+            stock=cls.stock,
+        )
+
+    def setUp(self):
+        cache.clear()
+        bump_offer_generation()  # drops the per-process offer snapshot too
+
+    def create_order(self, quantity=1, user=None, **fields):
+        fields.setdefault("payment_method", "razorpay")
+        order = Orders.objects.create(
+            user=user or self.user,
+            address=self.address,
+            total_price=self.variant.sales_price * quantity,
+            **fields,
+        )
+        OrderItem.objects.create(
+            order=order,
+            product=self.variant,
+            quantity=quantity,
+            unit_price=self.variant.sales_price,
+            price=self.variant.sales_price * quantity,
+        )
+        return order
+
+    def other_shopper(self):
+        return User.objects.create_user(email="other@example.com", password="pass")
+
+    def available(self):
+        return available_to_sell([self.variant.id])[self.variant.id]
+
+    def hold(self, order, quantity=1, lapsed=False):
+        """Takes the units and holds them for the order, as place_order does."""
+        with transaction.atomic():
+            take_units({self.variant.id: quantity})
+            hold_stock(order, {self.variant.id: quantity})
+        if lapsed:
+            order.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+
+class ReservationTests(ShopTestCase):
+    stock = 2
+
+    def admitted(self):
+        """The ledger's admission counter, None in classic mode."""
+        return cache.get(ADMIT_KEY.format(self.variant.id))
+
+    def test_hold_takes_the_units_off_sale(self):
+        order = self.create_order(quantity=2)
+        self.hold(order, quantity=2)
+
+        self.assertEqual(self.available(), 0)
+        self.assertEqual(available_to_sell([self.variant.id], exclude_user=self.user)[self.variant.id], 2)
+
+    def test_released_hold_puts_the_units_back(self):
+        order = self.create_order()
+        self.hold(order)
+        before = self.admitted()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_holds(order), 1)
+
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(order.reservations.get().status, "released")
+        if before is not None:
+            self.assertEqual(self.admitted(), before + 1)
+        # nothing left to release
+        self.assertEqual(release_holds(order), 0)
+
+    def test_only_lapsed_holds_are_swept(self):
+        lapsed = self.create_order()
+        self.hold(lapsed, lapsed=True)
+        live = self.create_order(user=self.other_shopper())
+        self.hold(live)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_expired_holds(), 1)
+
+        self.assertEqual(lapsed.reservations.get().status, "released")
+        self.assertEqual(live.reservations.get().status, "active")
+        self.assertEqual(self.available(), 1)
+        if self.admitted() is not None:
+            self.assertEqual(self.admitted(), 1)
+
+
+@override_settings(INVENTORY_LEDGER=True)
+class LedgerReservationTests(ReservationTests):
+    pass
+
+
+class OfferSnapshotTests(ShopTestCase):
+    def test_saved_offer_bumps_the_generation_on_commit(self):
+        generation = get_offer_generation()
+        self.assertNotIn(self.product.id, get_active_offer_snapshot()["product"])
+
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            offer = ProductOffer.objects.create(
+                product=self.product, discount_percent=Decimal("10"),
+                start_date=now - timedelta(days=1), end_date=now + timedelta(days=1),
+            )
+            # not committed yet: readers keep the old snapshot
+            self.assertEqual(get_offer_generation(), generation)
+            self.assertNotIn(self.product.id, get_active_offer_snapshot()["product"])
+
+        self.assertEqual(get_offer_generation(), generation + 1)
+        self.assertEqual(get_active_offer_snapshot()["product"][self.product.id], [offer])
+
+    def test_snapshot_is_served_until_the_generation_moves(self):
+        snapshot = get_active_offer_snapshot()
+        self.assertIs(get_active_offer_snapshot(), snapshot)
+
+        bump_offer_generation()
+        self.assertIsNot(get_active_offer_snapshot(), snapshot)
+
+
+class RenewHoldTests(ShopTestCase):
+    def test_extends_a_live_hold(self):
+        order = self.create_order()
+        self.hold(order)
+
+        with transaction.atomic():
+            renew_hold(order)
+
+        self.assertEqual(order.reservations.filter(status="active").count(), 1)
+
+    def test_lapsed_hold_loses_the_last_unit_to_another_order(self):
+        order = self.create_order()
+        self.hold(order, lapsed=True)
+        other = self.create_order(user=self.other_shopper())
+        self.hold(other)
+
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            renew_hold(order)
+
+
+@override_settings(INVENTORY_LEDGER=True)
+class LedgerRenewHoldTests(ShopTestCase):
+    def test_lapsed_hold_on_the_last_unit_is_reused(self):
+        order = self.create_order()
+        self.hold(order, lapsed=True)
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            renew_hold(order)
+
+        hold = order.reservations.get(status="active")
+        self.assertGreater(hold.expires_at, timezone.now())
+        self.assertEqual(order.reservations.filter(status="released").count(), 1)
+        self.assertEqual(cache.get(ADMIT_KEY.format(self.variant.id)), 0)
+
+
+@override_settings(PAYMENT_GATEWAY="fake")
+class RazorpayCallbackTests(ShopTestCase):
+    """start_razorpay_payment and razorpay_success against FakeGateway."""
+
+    def setUp(self):
+        super().setUp()
+        get_gateway.cache_clear()
+        self.addCleanup(get_gateway.cache_clear)
+        self.gateway = get_gateway()
+        self.client.force_login(self.user)
+        self.order = self.create_order()
+        response = self.client.get(reverse("razorpay_start", args=[self.order.order_id]))
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+
+    def callback(self, payload):
+        return self.client.post(reverse("razorpay_success"), json.dumps(payload), content_type="application/json")
+
+    def lapse_and_sweep(self):
+        self.order.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            release_expired_holds()
+
+    def assertPaid(self, payload):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "paid")
+        self.assertEqual(self.order.razorpay_payment_id, payload["razorpay_payment_id"])
+        self.assertEqual(self.order.reservations.filter(status="committed").count(), 1)
+        self.assertEqual(self.available(), 0)
+
+    def test_authorized_payment_is_captured(self):
+        payload = self.gateway.pay(self.order.razorpay_order_id)
+
+        response = self.callback(payload)
+
+        self.assertEqual(response.json(), {"success": True})
+        self.assertPaid(payload)
+        self.assertIn("payment.capture", self.gateway.calls)
+        self.assertEqual(self.gateway.payments[payload["razorpay_payment_id"]]["status"], "captured")
+
+    def test_captured_payment_is_not_captured_again(self):
+        payload = self.gateway.pay(self.order.razorpay_order_id, status="captured")
+
+        response = self.callback(payload)
+
+        self.assertEqual(response.json(), {"success": True})
+        self.assertPaid(payload)
+        self.assertNotIn("payment.capture", self.gateway.calls)
+
+    def test_bad_signature_is_rejected(self):
+        payload = self.gateway.pay(self.order.razorpay_order_id)
+        payload["razorpay_signature"] = "0" * 64
+
+        response = self.callback(payload)
+
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "pending")
+
+    def test_lapsed_hold_takes_the_stock_again(self):
+        self.lapse_and_sweep()
+        payload = self.gateway.pay(self.order.razorpay_order_id)
+
+        response = self.callback(payload)
+
+        self.assertEqual(response.json(), {"success": True})
+        self.assertPaid(payload)
+
+    def test_lapsed_hold_without_stock_is_refunded_to_the_wallet(self):
+        self.lapse_and_sweep()
+        self.hold(self.create_order(user=self.other_shopper()))
+        payload = self.gateway.pay(self.order.razorpay_order_id, status="captured")
+
+        response = self.callback(payload)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["redirect"], reverse("user_order_detail", args=[self.order.order_id]))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "refunded")
+        self.assertEqual(self.order.refunded_amount, self.variant.sales_price)
+        self.assertFalse(self.order.items.exclude(status="cancelled").exists())
+        self.assertEqual(Wallet.objects.get(user=self.user).balance, self.variant.sales_price)
+
+    def test_lapsed_hold_without_stock_is_never_captured(self):
+        self.lapse_and_sweep()
+        self.hold(self.create_order(user=self.other_shopper()))
+        payload = self.gateway.pay(self.order.razorpay_order_id)
+
+        response = self.callback(payload)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn("payment.capture", self.gateway.calls)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "cancelled")
+        self.assertFalse(Wallet.objects.filter(user=self.user, balance__gt=0).exists())
+
+    def test_second_payment_settled_elsewhere_is_refunded(self):
+        first = self.gateway.pay(self.order.razorpay_order_id)
+        second = self.gateway.pay(self.order.razorpay_order_id)
+        capture = self.gateway.capture_payment
+
+        def capture_after_the_first_callback(payment_id, amount):
+            # the callback for `first` settles the order while ours talks to Razorpay
+            if payment_id == second["razorpay_payment_id"]:
+                self.assertEqual(self.callback(first).json(), {"success": True})
+            return capture(payment_id, amount)
+
+        with mock.patch.object(self.gateway, "capture_payment", side_effect=capture_after_the_first_callback):
+            response = self.callback(second)
+
+        self.assertEqual(response.json(), {"success": True})
+        self.assertPaid(first)
+        self.assertEqual(self.gateway.payments[second["razorpay_payment_id"]]["status"], "refunded")
+
+    def test_replayed_callback_gets_the_same_answer(self):
+        payload = self.gateway.pay(self.order.razorpay_order_id)
+        self.callback(payload)
+
+        response = self.callback(payload)
+
+        self.assertEqual(response.json(), {"success": True})
+        self.assertEqual(self.gateway.calls.count("payment.capture"), 1)
+
+
+@override_settings(INVENTORY_LEDGER=True)
+class LedgerRazorpayCallbackTests(RazorpayCallbackTests):
+    pass
+
+
+class CoPurchaseIndexTests(ShopTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        chairs = Product.objects.create(name="Dining chair", category=cls.category)
+        cls.teak_chair, cls.pine_chair = (
+            ProductVariant.objects.create(
+                product=chairs, material_type=wood, regular_price=Decimal("1500.00"),
+                sales_price=Decimal("1200.00"), description=f"{wood} chair", stock=10,
+            )
+            for wood in ("Teak", "Pine")
+        )
+        cls.bench, cls.cushion = (
+            ProductVariant.objects.create(
+                product=Product.objects.create(name=name, category=cls.category), material_type="Teak",
+                regular_price=Decimal("900.00"), sales_price=Decimal("800.00"), description=name, stock=10,
+            )
+            for name in ("Bench", "Seat cushion")
+        )
+
+    def deliver(self, *variants):
+        order = Orders.objects.create(user=self.user, address=self.address, total_price=0, payment_method="cod")
+        for variant in variants:
+            OrderItem.objects.create(
+                order=order, product=variant, quantity=1, unit_price=variant.sales_price,
+                price=variant.sales_price, status="delivered",
+            )
+        return order
+
+    def index(self):
+        return (
+            list(CoPurchasePair.objects.order_by("product_a", "product_b").values_list("product_a", "product_b", "count")),
+            list(CoPurchaseNeighbours.objects.order_by("product").values_list("product", "neighbour_ids", "counts")),
+            list(VariantCoPurchasePair.objects.order_by("variant_a", "variant_b").values_list("variant_a", "variant_b", "count")),
+            list(VariantCoPurchaseNeighbours.objects.order_by("variant").values_list("variant", "neighbour_ids", "counts")),
+        )
+
+    def test_resumed_run_matches_a_rebuild(self):
+        orders = [
+            self.deliver(self.variant, self.teak_chair, self.teak_chair),
+            self.deliver(self.variant, self.teak_chair, self.bench),
+            self.deliver(self.teak_chair, self.pine_chair),
+            self.deliver(self.pine_chair, self.cushion),
+            self.deliver(self.variant, self.pine_chair, self.cushion),
+        ]
+        next_batch = co_purchase._next_batch
+        calls = []
+
+        def fail_on_second_batch(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("worker killed")
+            return next_batch(*args)
+
+        with mock.patch.object(co_purchase, "_next_batch", fail_on_second_batch), self.assertRaises(RuntimeError):
+            co_purchase.update_co_purchase_index(batch_size=2)
+        self.assertEqual(CoPurchaseState.objects.get().last_order_id, orders[1].id)
+
+        co_purchase.update_co_purchase_index(batch_size=2)
+        resumed = self.index()
+        co_purchase.update_co_purchase_index(rebuild=True)
+
+        self.assertEqual(resumed, self.index())
+        self.assertTrue(all(resumed))
+
+    def test_cart_variants_rank_their_own_neighbours(self):
+        self.deliver(self.teak_chair, self.bench)
+        self.deliver(self.teak_chair, self.bench)
+        self.deliver(self.pine_chair, self.cushion)
+        co_purchase.update_co_purchase_index()
+
+        self.assertEqual(co_purchase.variants_bought_together([self.teak_chair.id], 4), [self.bench.product_id])
+        self.assertEqual(co_purchase.variants_bought_together([self.pine_chair.id], 4), [self.cushion.product_id])
+        # both are bought with the chair product
+        self.assertCountEqual(
+            co_purchase.bought_together([self.teak_chair.product_id], 4),
+            [self.bench.product_id, self.cushion.product_id],
+        )
+
+
+class BatchPricingTests(ShopTestCase):
+    """get_pricing_contexts prices every variant exactly as get_pricing_context does."""
+
+    def add_variant(self, product, price):
+        return ProductVariant.objects.create(
+            product=product, material_type="Pine", regular_price=price + 500,
+            sales_price=price, description="Pine table", stock=3,
+        )
+
+    def test_batch_matches_per_variant(self):
+        now = timezone.now()
+        running = {"start_date": now - timedelta(days=1), "end_date": now + timedelta(days=1)}
+        expired = {"start_date": now - timedelta(days=3), "end_date": now - timedelta(days=1)}
+        lamps = Category.objects.create(name="Lamps", image="categories/lamps.jpg")
+        pine = Product.objects.create(name="Pine table", category=self.category)
+        teak = Product.objects.create(name="Teak table", category=self.category)
+        level = Product.objects.create(name="Level table", category=self.category)
+        lamp = Product.objects.create(name="Brass lamp", category=lamps)
+        for product, price in ((pine, 1000), (pine, 3000), (teak, 2000), (level, 2500), (lamp, 800)):
+            self.add_variant(product, Decimal(price))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CategoryOffer.objects.create(
+                category=self.category, discount_percent=Decimal("10"), max_discount_amount=Decimal("300"), **running
+            )
+            CategoryOffer.objects.create(category=lamps, discount_percent=Decimal("30"), **expired)
+            # beats the category offer on the oak table
+            oak_offer = ProductOffer.objects.create(product=self.product, discount_percent=Decimal("15"), **running)
+            # a flat 50 loses to the capped category offer on both pine variants
+            ProductOffer.objects.create(product=pine, discount_type="flat", discount_percent=Decimal("50"), **running)
+            ProductOffer.objects.create(product=teak, discount_percent=Decimal("50"), **expired)
+            ProductOffer.objects.create(product=teak, discount_percent=Decimal("40"), is_active=False, **running)
+            # ties with the category offer: the product offer wins
+            ProductOffer.objects.create(product=level, discount_percent=Decimal("10"), **running)
+
+        variants = list(ProductVariant.objects.select_related("product__category").order_by("id"))
+        batch = get_pricing_contexts(variants)
+        from_db = get_pricing_contexts(variants, now=timezone.now())
+        for variant in variants:
+            single = get_pricing_context(variant)
+            self.assertEqual(batch[variant.id], single, variant.product.name)
+            self.assertEqual(from_db[variant.id], single, variant.product.name)
+
+        self.assertEqual(batch[self.variant.id]["applied_offer"], oak_offer)
+        self.assertFalse(batch[lamp.variants.get().id]["is_offer_applied"])
+
+
+class DiscountTests(ShopTestCase):
+    """compute_discounts and discount_expression agree with compute_discount."""
+
+    EDGE_ROWS = [
+        (Decimal("4000.00"), Decimal("10.00"), None, "percentage"),
+        (Decimal("4000.00"), Decimal("10.00"), Decimal("250.00"), "percentage"),
+        (Decimal("4000.00"), Decimal("10.00"), Decimal("0.00"), "percentage"),
+        (Decimal("4000.00"), Decimal("0.00"), None, "percentage"),
+        (Decimal("0.05"), Decimal("50.00"), None, "percentage"),  # rounds half up
+        (Decimal("999.99"), Decimal("33.33"), None, "percentage"),
+        (Decimal("4000.00"), Decimal("150.00"), None, "percentage"),
+        (Decimal("4000.00"), Decimal("500.00"), None, "flat"),
+        (Decimal("400.00"), Decimal("500.00"), None, "flat"),
+    ]
+
+    def random_rows(self, n):
+        rng = random.Random(4)
+        money = lambda high: Decimal(rng.randint(0, high * 100)) / 100
+        rows = []
+        for _ in range(n):
+            discount_type = rng.choice(["percentage", "percentage", "flat"])
+            percent = money(100) if discount_type == "percentage" else money(5000)
+            rows.append((money(20000), percent, rng.choice([None, Decimal(0), money(3000)]), discount_type))
+        return rows
+
+    def test_batch_matches_per_row(self):
+        rows = self.EDGE_ROWS + self.random_rows(2000)
+        rows += rows[:50]  # repeated rows are computed once
+
+        self.assertEqual(compute_discounts(rows), [compute_discount(*row) for row in rows])
+
+    def test_expression_matches_python(self):
+        now = timezone.now()
+        for i, (price, percent, cap, discount_type) in enumerate(self.EDGE_ROWS):
+            product = Product.objects.create(name=f"Table {i}", category=self.category)
+            ProductVariant.objects.create(
+                product=product, material_type="Oak", regular_price=price,
+                sales_price=price, description="Oak table", stock=1,
+            )
+            ProductOffer.objects.create(
+                product=product, discount_type=discount_type, discount_percent=percent,
+                max_discount_amount=cap, start_date=now, end_date=now + timedelta(days=1),
+            )
+
+        rows = ProductOffer.objects.annotate(
+            price=F("product__variants__sales_price"),
+            discount=discount_expression("price", "discount_percent", "max_discount_amount", "discount_type"),
+        )
+        self.assertEqual(len(rows), len(self.EDGE_ROWS))
+        for offer in rows:
+            expected = compute_discount(offer.price, offer.discount_percent, offer.max_discount_amount, offer.discount_type)
+            self.assertEqual(offer.discount, expected, (offer.price, offer.discount_percent, offer.discount_type))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class IdempotentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.runs = 0
+        self.status = 200
+
+        @idempotent("test", lambda request: request.POST.get("key"))
+        def view(request):
+            self.runs += 1
+            return HttpResponse(f"run {self.runs}", status=self.status)
+
+        self.view = view
+        self.factory = RequestFactory()
+
+    def post(self, key="k1"):
+        return self.view(self.factory.post("/", {"key": key}))
+
+    def test_replays_a_success(self):
+        self.post()
+        response = self.post()
+
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(response.content, b"run 1")
+        self.assertEqual(response["Idempotent-Replay"], "true")
+
+    def test_other_keys_run_the_view(self):
+        self.post("k1")
+        self.post("k2")
+
+        self.assertEqual(self.runs, 2)
+
+    def test_failure_frees_the_key(self):
+        self.status = 400
+        self.post()
+        self.status = 200
+        response = self.post()
+
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(response.content, b"run 2")
+
+    def test_duplicate_in_flight_gets_409(self):
+        cache.add(idempotency.IDEMPOTENCY_KEY.format("test", "k1"), idempotency._IN_FLIGHT)
+
+        with mock.patch.object(idempotency, "WAIT_SECONDS", 0):
+            response = self.post()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.runs, 0)
+
+
+class PlaceOrderIdempotencyTests(ShopTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, variant=self.variant, quantity=1)
+
+    def place_order(self):
+        return self.client.post(reverse("place_order"), {
+            "address": self.address.id,
+            "payment_method": "wallet",
+            "idempotency_key": "checkout-1",
+        })
+
+    def test_failed_submit_can_be_retried_and_a_placed_order_is_replayed(self):
+        response = self.place_order()
+        self.assertRedirects(response, reverse("checkout"), fetch_redirect_response=False)
+        self.assertFalse(Orders.objects.exists())
+
+        Wallet.objects.filter(user=self.user).update(balance=Decimal("10000.00"))
+        response = self.place_order()
+        order = Orders.objects.get()
+        self.assertRedirects(response, reverse("order_success", args=[order.order_id]), fetch_redirect_response=False)
+
+        response = self.place_order()
+        self.assertEqual(response["Idempotent-Replay"], "true")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], reverse("order_success", args=[order.order_id]))
+        self.assertEqual(Orders.objects.count(), 1)
+
+
+class CheckoutStockTests(ShopTestCase):
+    """The checkout page and place_order agree on what is left to sell."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, variant=self.variant, quantity=1)
+
+    def test_unit_held_by_another_shopper_is_not_for_sale(self):
+        self.hold(self.create_order(user=self.other_shopper()))
+
+        self.assertRedirects(self.client.get(reverse("checkout")), reverse("cart_page"), fetch_redirect_response=False)
+        response = self.client.post(reverse("place_order"), {
+            "address": self.address.id, "payment_method": "cod", "idempotency_key": "checkout-1",
+        })
+        self.assertRedirects(response, reverse("cart_page"), fetch_redirect_response=False)
+
+    def test_own_hold_does_not_block_checkout(self):
+        self.hold(self.create_order())
+
+        self.assertEqual(self.client.get(reverse("checkout")).status_code, 200)
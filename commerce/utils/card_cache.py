@@ -0,0 +1,92 @@
+import hashlib
+import logging
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from commerce.services.inventory import attach_live_stock
+from .offer_cache import get_offer_generation
+
+logger = logging.getLogger("product")
+
+CARD_TEMPLATE = "product/components/product_card.html"
+CARD_KEY = "card:{}:{}"
+CARD_TTL = 60 * 60 * 24
+CARD_METRIC_KEYS = {"hits": "card:metrics:hits", "misses": "card:metrics:misses"}
+
+
+def card_version(product, generation):
+    """
+    Digest of everything the card renders: the product row, its cover
+    image, rating annotations, each variant's price/stock/material and the
+    pricing attached for this request, plus the offer generation.
+    """
+    pricing = getattr(product, "pricing", None) or {}
+    parts = [
+        product.updated_at.isoformat() if product.updated_at else "",
+        product.primary_image_id,
+        getattr(product, "average_rating", None),
+        getattr(product, "review_count", None),
+        generation,
+        pricing.get("current_price"),
+        pricing.get("base_price"),
+        pricing.get("offer_percent"),
+        getattr(product, "display_price", None),
+    ]
+    for v in product.variants.all():
+        parts.extend([v.id, v.material_type, v.sales_price, v.stock > 0])
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _count(metric, amount):
+    if not amount:
+        return
+    key = CARD_METRIC_KEYS[metric]
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+
+
+def card_cache_stats():
+    values = cache.get_many(CARD_METRIC_KEYS.values())
+    stats = {name: values.get(key, 0) for name, key in CARD_METRIC_KEYS.items()}
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / total, 3) if total else None
+    return stats
+
+
+def attach_card_html(products):
+    """
+    Sets product.card_html for a page of priced products (run
+    attach_best_pricing_to_products first). Cached cards come back in one
+    get_many; only the misses are rendered. The wishlist heart is not part
+    of the cached HTML, it is filled in client side.
+    """
+    products = list(products)
+    if not products:
+        return
+    attach_live_stock(v for p in products for v in p.variants.all())
+    generation = get_offer_generation()
+    keys = {p.id: CARD_KEY.format(p.id, card_version(p, generation)) for p in products}
+    cached = cache.get_many(keys.values())
+
+    to_store = {}
+    for p in products:
+        key = keys[p.id]
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(CARD_TEMPLATE, {"p": p})
+            to_store[key] = html
+        p.card_html = mark_safe(html)
+
+    if to_store:
+        cache.set_many(to_store, timeout=CARD_TTL)
+
+    misses = len(to_store)
+    _count("hits", len(products) - misses)
+    _count("misses", misses)
+    logger.debug(
+        "Product card cache",
+        extra={"hits": len(products) - misses, "misses": misses}
+    )
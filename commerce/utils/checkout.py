@@ -3,7 +3,7 @@ from django.http import HttpResponse
 from django.utils import timezone
 from django.db.models import Count, Q
 from django.shortcuts import render
-from commerce.utils.offers import get_discount_percentage
+from commerce.services.cart_pricing import CartPricing
 from commerce.utils.coupons import validate_and_calculate_coupon
 from commerce.models import Cart
 from commerce.utils.trigger import attach_trigger
@@ -21,17 +21,9 @@ def render_checkout_summary(request, error_message=None, success_message=None):
     if not cart:
         return HttpResponse('<div id="coupon-section" class="p-4 text-red-500">Cart is empty.</div>')
 
-    items = cart.items.select_related("variant", "product")
-    subtotal = Decimal("0")
-    offer_discount = Decimal("0")
-
-    for item in items:
-        price = Decimal(item.variant.sales_price)
-        offer_percent = get_discount_percentage(item.variant) or 0
-        discounted_price = price - (price * Decimal(offer_percent) / 100)
-
-        subtotal += discounted_price * item.quantity
-        offer_discount += (price - discounted_price) * item.quantity
+    cart_pricing = CartPricing.for_request(request, cart)
+    subtotal = cart_pricing.subtotal
+    offer_discount = cart_pricing.offer_discount
 
     coupon_code = request.session.get("applied_coupon")
     coupon = None
@@ -49,9 +41,9 @@ def render_checkout_summary(request, error_message=None, success_message=None):
             if not error_message: 
                 error_message = err
 
-    shipping_cost = Decimal("0") if subtotal >= 1000 else Decimal("80")
-    total = subtotal - coupon_discount + shipping_cost
-    cod_allowed= total<=1000
+    shipping_cost = cart_pricing.shipping_cost
+    total = cart_pricing.total(coupon_discount)
+    cod_allowed = cart_pricing.cod_allowed(coupon_discount)
 
 
     now = timezone.now()
@@ -102,44 +94,3 @@ def render_checkout_summary(request, error_message=None, success_message=None):
         return attach_trigger(response, success_message, type="success")
 
     return response
-
-# def render_checkout_summary(request):
-#     user = request.user
-#     cart = Cart.objects.get(user=user)
-#     items = cart.items.select_related("variant", "product")
-
-#     subtotal = Decimal("0")
-#     offer_discount = Decimal("0")
-
-#     for item in items:
-#         price = Decimal(item.variant.sales_price)
-#         offer_percent = get_discount_percentage(item.variant) or 0
-#         discounted_price = price - (price * Decimal(offer_percent) / 100)
-
-#         subtotal += discounted_price * item.quantity
-#         offer_discount += (price - discounted_price) * item.quantity
-
-#     coupon = None
-#     coupon_discount = Decimal("0")
-#     coupon_code = request.session.get("applied_coupon")
-
-#     if coupon_code:
-#         coupon, coupon_discount,err = validate_and_calculate_coupon(
-#             coupon_code, user, subtotal
-#         )
-
-#     shipping_cost = Decimal("0") if subtotal >= 1000 else Decimal("80")
-#     total = subtotal - coupon_discount + shipping_cost
-
-#     return render(
-#         request,
-#         "commerce/checkout/_coupon_totals.html",
-#         {
-#             "coupon": coupon,
-#             "coupon_discount": coupon_discount,
-#             "offer_discount": offer_discount,
-#             "subtotal": subtotal,
-#             "shipping_cost": shipping_cost,
-#             "total": total,
-#         }
-#     )
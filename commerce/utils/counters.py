@@ -0,0 +1,55 @@
+from django.core.cache import cache
+from commerce.models import CartItem, WishlistItem
+
+CART_COUNT_KEY = "counter:cart:{}"
+WISHLIST_COUNT_KEY = "counter:wishlist:{}"
+COUNTER_TTL = 60 * 60 * 6
+
+
+def _get_or_rebuild(key, rebuild):
+    count = cache.get(key)
+    if count is None:
+        count = rebuild()
+        cache.set(key, count, timeout=COUNTER_TTL)
+    return count
+
+
+def get_cart_count(user_id):
+    return _get_or_rebuild(
+        CART_COUNT_KEY.format(user_id),
+        lambda: CartItem.objects.filter(cart__user_id=user_id).count(),
+    )
+
+
+def get_wishlist_count(user_id):
+    return _get_or_rebuild(
+        WISHLIST_COUNT_KEY.format(user_id),
+        lambda: WishlistItem.objects.filter(wishlist__user_id=user_id).count(),
+    )
+
+
+def _adjust(key, delta):
+    # incr is atomic in redis; a missing key is simply rebuilt on next read
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def adjust_cart_count(user_id, delta):
+    _adjust(CART_COUNT_KEY.format(user_id), delta)
+
+
+def adjust_wishlist_count(user_id, delta):
+    _adjust(WISHLIST_COUNT_KEY.format(user_id), delta)
+
+
+def reset_cart_count(user_id):
+    cache.delete(CART_COUNT_KEY.format(user_id))
+
+
+def header_counts(user_id):
+    return {
+        "cart": get_cart_count(user_id),
+        "wishlist": get_wishlist_count(user_id),
+    }
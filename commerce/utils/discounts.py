@@ -0,0 +1,75 @@
+from decimal import ROUND_HALF_UP, Decimal
+from django.db.models import Case, When, F, Value, DecimalField
+from django.db.models.functions import Coalesce, Greatest, Least, Round
+from django.db.models.lookups import Exact, GreaterThan
+
+# The one place offer discounts are computed. Python callers go through
+# compute_discount(s); SQL callers use discount_expression, which mirrors
+# it. commerce.tests checks that all three agree.
+
+PAISE = Decimal("0.01")
+
+
+def compute_discount(price, percent, cap=None, discount_type="percentage"):
+    price = Decimal(price)
+    percent = Decimal(percent or 0)
+
+    if discount_type == "percentage":
+        discount = price * percent / Decimal(100)
+        if cap:
+            discount = min(discount, Decimal(cap))
+    else:
+        discount = percent
+
+    discount = min(max(Decimal(0), discount), price)
+    return discount.quantize(PAISE, rounding=ROUND_HALF_UP)
+
+
+def compute_discounts(rows):
+    """
+    rows: iterable of (price, percent, cap, discount_type).
+    Returns the discounts as a list in the same order, each equal to
+    compute_discount(*row).
+
+    A listing or a catalogue refresh prices many variants against a
+    handful of offers, so rows repeat: each distinct row is computed once
+    and the results are mapped back onto the batch.
+    """
+    rows = list(rows)
+    distinct = dict.fromkeys(rows)
+    for row in distinct:
+        distinct[row] = compute_discount(*row)
+    return [distinct[row] for row in rows]
+
+
+def offer_row(price, offer):
+    if not offer:
+        return (price, 0, None, "percentage")
+    return (price, offer.discount_percent, offer.max_discount_amount, offer.discount_type)
+
+
+def discount_expression(price, percent, cap, discount_type):
+    """
+    ORM equivalent of compute_discount. Arguments are field names or
+    expressions, e.g. discount_expression('product__variants__sales_price',
+    'discount_percent', 'max_discount_amount', 'discount_type') on ProductOffer.
+    """
+    price, percent, cap, discount_type = (
+        F(arg) if isinstance(arg, str) else arg
+        for arg in (price, percent, cap, discount_type)
+    )
+    money = DecimalField(max_digits=10, decimal_places=2)
+    zero = Value(Decimal(0), output_field=money)
+
+    percentage_off = price * percent / Value(100)
+    capped = Case(
+        When(GreaterThan(Coalesce(cap, zero), zero), then=Least(percentage_off, cap)),
+        default=percentage_off,
+        output_field=money,
+    )
+    raw = Case(
+        When(Exact(discount_type, Value("percentage")), then=capped),
+        default=percent,
+        output_field=money,
+    )
+    return Round(Least(Greatest(raw, zero), price, output_field=money), 2, output_field=money)
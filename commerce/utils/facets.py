@@ -0,0 +1,150 @@
+from decimal import Decimal, InvalidOperation
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from product.models import Product, ProductVariant
+
+FACET_VERSION_KEY = "facets:version"
+FACET_ROWS_KEY = "facets:rows:{}"
+FACET_ROWS_TTL = 60 * 60
+
+PRICE_BUCKETS = [
+    ("0-4999", "₹0 – ₹4,999"),
+    ("5000-24999", "₹5,000 – ₹24,999"),
+    ("25000-49999", "₹25,000 – ₹49,999"),
+    ("50000-99999", "₹50,000 – ₹99,999"),
+    ("100000-9999999", "₹100,000+"),
+]
+RATING_BANDS = [
+    (4, "4★ & up"),
+    (3, "3★ & up"),
+    (2, "2★ & up"),
+    (1, "1★ & up"),
+]
+
+
+def _facet_version():
+    version = cache.get(FACET_VERSION_KEY)
+    if version is None:
+        cache.add(FACET_VERSION_KEY, 1, timeout=None)
+        version = cache.get(FACET_VERSION_KEY, 1)
+    return version
+
+
+def _bump_facet_version():
+    try:
+        cache.incr(FACET_VERSION_KEY)
+    except ValueError:
+        cache.add(FACET_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_facets():
+    transaction.on_commit(_bump_facet_version)
+
+
+def _build_rows():
+    """
+    One grouped query over the listable catalog:
+    (product_id, category_id, min_effective_price, avg_rating, [materials]).
+    """
+    rows = (
+        Product.objects.filter(
+            Exists(ProductVariant.objects.filter(product=OuterRef("pk"))),
+            category__is_deleted=False,
+        )
+        .order_by()
+        .values("id", "category_id", "min_effective_price")
+        .annotate(
+            rating=Max("rating_summary__average_rating"),
+            materials=ArrayAgg(
+                "variants__material_type",
+                distinct=True,
+                filter=Q(variants__is_deleted=False),
+            ),
+        )
+    )
+    return [
+        (r["id"], r["category_id"], r["min_effective_price"], r["rating"] or 0, r["materials"] or [])
+        for r in rows
+    ]
+
+
+def get_facet_rows():
+    """Facet table for the whole catalog, cached until the catalog or prices change."""
+    key = FACET_ROWS_KEY.format(_facet_version())
+    rows = cache.get(key)
+    if rows is None:
+        rows = _build_rows()
+        cache.set(key, rows, timeout=FACET_ROWS_TTL)
+    return rows
+
+
+def parse_price_range(value):
+    try:
+        low, high = value.split("-")
+        return Decimal(low), Decimal(high)
+    except (ValueError, InvalidOperation):
+        return None
+
+
+def facet_counts(categories=(), price_ranges=(), materials=(), min_rating=None, product_ids=None):
+    """
+    Counts for every facet value, each computed against the other facets'
+    selections (so ticking a category still shows counts for its siblings).
+    product_ids limits the rows to e.g. the current search results.
+
+    Returns {"categories": {id: n}, "price": {range: n},
+             "materials": [(name, n)], "rating": {band: n}}.
+    """
+    rows = get_facet_rows()
+    if product_ids is not None:
+        product_ids = set(product_ids)
+        rows = [r for r in rows if r[0] in product_ids]
+
+    categories = {int(c) for c in categories}
+    ranges = [r for r in map(parse_price_range, price_ranges) if r]
+    materials = set(materials)
+
+    def in_category(row):
+        return not categories or row[1] in categories
+
+    def in_price(row):
+        return not ranges or (
+            row[2] is not None and any(low <= row[2] <= high for low, high in ranges)
+        )
+
+    def in_material(row):
+        return not materials or materials.intersection(row[4])
+
+    def in_rating(row):
+        return not min_rating or row[3] >= min_rating
+
+    checks = {"category": in_category, "price": in_price, "material": in_material, "rating": in_rating}
+
+    def others(row, skip):
+        return all(check(row) for name, check in checks.items() if name != skip)
+
+    counts = {"categories": {}, "price": {}, "materials": {}, "rating": {}}
+    buckets = [(key, parse_price_range(key)) for key, _ in PRICE_BUCKETS]
+
+    for row in rows:
+        if others(row, "category"):
+            counts["categories"][row[1]] = counts["categories"].get(row[1], 0) + 1
+
+        if others(row, "price") and row[2] is not None:
+            for key, (low, high) in buckets:
+                if low <= row[2] <= high:
+                    counts["price"][key] = counts["price"].get(key, 0) + 1
+
+        if others(row, "material"):
+            for material in row[4]:
+                counts["materials"][material] = counts["materials"].get(material, 0) + 1
+
+        if others(row, "rating"):
+            for band, _ in RATING_BANDS:
+                if row[3] >= band:
+                    counts["rating"][band] = counts["rating"].get(band, 0) + 1
+
+    counts["materials"] = sorted(counts["materials"].items())
+    return counts
@@ -0,0 +1,92 @@
+import functools
+import hashlib
+import time
+import uuid
+from django.core.cache import cache
+from django.http import HttpResponse
+
+IDEMPOTENCY_KEY = "idem:{}:{}"
+IDEMPOTENCY_TTL = 60 * 60 * 24
+
+# a claim outlives any sane request; if the worker dies the key frees itself
+IN_FLIGHT_TTL = 60
+# how long a duplicate waits for the first request's response
+WAIT_SECONDS = 5
+_POLL_SECONDS = 0.1
+_IN_FLIGHT = "in-flight"
+
+
+def new_idempotency_key():
+    """A key for a form to send back with its submit (see checkout)."""
+    return uuid.uuid4().hex
+
+
+def derived_key(*parts):
+    """A key derived from request fields, e.g. a payment callback's payload."""
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _freeze(response):
+    return {
+        "status": response.status_code,
+        "content": response.content,
+        "content_type": response["Content-Type"],
+        "location": response.get("Location"),
+    }
+
+
+def _thaw(stored):
+    response = HttpResponse(stored["content"], status=stored["status"], content_type=stored["content_type"])
+    if stored["location"]:
+        response["Location"] = stored["location"]
+    response["Idempotent-Replay"] = "true"
+    return response
+
+
+def succeeded(response):
+    return 200 <= response.status_code < 400
+
+
+def idempotent(scope, key_func, final=succeeded):
+    """
+    Runs the view once per key. key_func(request) returns the request's
+    key, or None to run the view unguarded.
+
+    The first request claims the key in redis; a duplicate that arrives
+    while it runs waits up to WAIT_SECONDS for its response (409 after
+    that), and a later replay gets the stored response straight from
+    redis, without a transaction or a payment-gateway call. Responses
+    that final(response) accepts (by default 2xx and 3xx) are kept for
+    IDEMPOTENCY_TTL; any other response, or an exception, frees the key
+    so the client can fix the problem and retry with it. Cookies are not
+    replayed.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = key_func(request)
+            if not key:
+                return view_func(request, *args, **kwargs)
+
+            cache_key = IDEMPOTENCY_KEY.format(scope, key)
+            deadline = time.monotonic() + WAIT_SECONDS
+            while not cache.add(cache_key, _IN_FLIGHT, timeout=IN_FLIGHT_TTL):
+                stored = cache.get(cache_key)
+                if stored not in (None, _IN_FLIGHT):
+                    return _thaw(stored)
+                if time.monotonic() >= deadline:
+                    return HttpResponse("This request is already being processed.", status=409)
+                time.sleep(_POLL_SECONDS)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+            if final(response) and not response.streaming:
+                cache.set(cache_key, _freeze(response), timeout=IDEMPOTENCY_TTL)
+            else:
+                cache.delete(cache_key)
+            return response
+        return wrapper
+    return decorator
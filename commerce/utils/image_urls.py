@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+from cloudinary.utils import cloudinary_url
+from django.core.cache import cache
+
+IMAGE_URLS_KEY = "img:urls:{}"
+IMAGE_URLS_TTL = 60 * 60 * 24 * 7
+LOCAL_LRU_SIZE = 2048
+
+COMMON_OPTIONS = {"secure": True, "fetch_format": "auto", "quality": "auto"}
+
+# name -> cloudinary transformation; srcset widths are rendered for every
+# rendition, scaled from its own width/height
+RENDITIONS = {
+    "thumb": {"width": 100, "height": 100, "crop": "fill", "gravity": "auto"},
+    "card": {"width": 300, "height": 300, "crop": "fill", "gravity": "auto"},
+    "detail": {"width": 800, "height": 800, "crop": "limit"},
+    "zoom": {"width": 1600, "height": 1600, "crop": "limit"},
+}
+SRCSET_WIDTHS = {
+    "thumb": (100, 200),
+    "card": (300, 450, 600),
+    "detail": (400, 800, 1200),
+    "zoom": (1600,),
+}
+
+# per-process LRU in front of redis, shared by the server's threads
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _public_id(image):
+    """Accepts a CloudinaryResource (ImageField value) or a public id / url string."""
+    if not image:
+        return None
+    return getattr(image, "public_id", None) or str(image)
+
+
+def _url(public_id, options):
+    url, _ = cloudinary_url(public_id, **COMMON_OPTIONS, **options)
+    return url
+
+
+def _build(public_id):
+    urls = {}
+    for name, options in RENDITIONS.items():
+        urls[name] = _url(public_id, options)
+        ratio = options["height"] / options["width"]
+        urls[name + "_srcset"] = ", ".join(
+            "{} {}w".format(
+                _url(public_id, {**options, "width": w, "height": round(w * ratio)}), w
+            )
+            for w in SRCSET_WIDTHS[name]
+        )
+    return urls
+
+
+def _remember(public_id, urls):
+    with _local_lock:
+        _local[public_id] = urls
+        _local.move_to_end(public_id)
+        while len(_local) > LOCAL_LRU_SIZE:
+            _local.popitem(last=False)
+
+
+def _recall(public_id):
+    with _local_lock:
+        urls = _local.get(public_id)
+        if urls is not None:
+            _local.move_to_end(public_id)
+        return urls
+
+
+def get_renditions_many(images):
+    """
+    Returns {public_id: {"thumb": url, "thumb_srcset": "...", "card": ...}}
+    for the given images. Served from process memory, then redis (one
+    get_many for the misses), and only built for ids seen nowhere.
+    """
+    public_ids = {_public_id(image) for image in images} - {None}
+    result = {}
+
+    missing = []
+    for public_id in public_ids:
+        urls = _recall(public_id)
+        if urls is not None:
+            result[public_id] = urls
+        else:
+            missing.append(public_id)
+
+    if missing:
+        keys = {IMAGE_URLS_KEY.format(pid): pid for pid in missing}
+        cached = cache.get_many(keys.keys())
+
+        to_store = {}
+        for key, public_id in keys.items():
+            urls = cached.get(key)
+            if urls is None:
+                urls = _build(public_id)
+                to_store[key] = urls
+            result[public_id] = urls
+            _remember(public_id, urls)
+
+        if to_store:
+            cache.set_many(to_store, timeout=IMAGE_URLS_TTL)
+
+    return result
+
+
+def get_renditions(image):
+    public_id = _public_id(image)
+    if public_id is None:
+        return {}
+    return get_renditions_many([public_id])[public_id]
+
+
+def rendition_url(image, name):
+    return get_renditions(image).get(name)
+
+
+def warm_primary_images(products):
+    """Fetches renditions for a page of products (primary_image selected) in one round trip."""
+    get_renditions_many(p.primary_image.image for p in products if p.primary_image_id)
+
+
+def invalidate_image_urls(*images):
+    """Drops cached renditions, e.g. when a product image is replaced."""
+    public_ids = [pid for pid in map(_public_id, images) if pid]
+    with _local_lock:
+        for public_id in public_ids:
+            _local.pop(public_id, None)
+    if public_ids:
+        cache.delete_many([IMAGE_URLS_KEY.format(pid) for pid in public_ids])
@@ -0,0 +1,156 @@
+import base64
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.exceptions import FieldError, ValidationError
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+COUNT_CACHE_KEY = "keyset:count:{}"
+COUNT_CACHE_TTL = 60 * 5
+
+# ?sort= value -> (field, descending); id is always the tie-breaker
+LISTING_SORTS = {
+    "low_to_high": ("final_min_price", False),
+    "high_to_low": ("final_min_price", True),
+    "a_to_z": ("name", False),
+    "z_to_a": ("name", True),
+    "new": ("created_at", True),
+    "relevance": ("search_rank", True),
+}
+DEFAULT_SORT = ("id", False)
+# float sorts are keyed on this double precision copy, see _keyed
+FLOAT_KEY = "keyset_key"
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([None if value is None else str(value), pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        if value is not None and not isinstance(value, str):
+            return None
+        return value, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def _cursor_position(queryset, field, cursor):
+    """
+    The decoded cursor with its value converted to the sort field's type
+    (Decimal, datetime, ...), or None for a missing or tampered cursor.
+    """
+    position = decode_cursor(cursor)
+    if position is None or field == "id" or position[0] is None:
+        return position
+    value, pk = position
+    try:
+        output_field = queryset.query.resolve_ref(field).output_field
+        return output_field.to_python(value), pk
+    except (ValidationError, FieldError, ValueError, TypeError):
+        return None
+
+
+def _keyed(queryset, field):
+    """
+    (queryset, key field) to paginate on. SearchRank and trigram scores are
+    Postgres reals: the value read back is rounded to its shortest text and
+    no longer equals the stored real, so a cursor on it would match its own
+    row again. Comparing both sides as double precision keeps them exact.
+    """
+    if field == "id":
+        return queryset, field
+    try:
+        output_field = queryset.query.resolve_ref(field).output_field
+    except FieldError:
+        return queryset, field
+    if not isinstance(output_field, FloatField):
+        return queryset, field
+    return queryset.annotate(**{FLOAT_KEY: Cast(field, FloatField())}), FLOAT_KEY
+
+
+def _ordering(field, descending):
+    if field == "id":
+        return ["-id" if descending else "id"]
+    expr = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+    return [expr, "-id" if descending else "id"]
+
+
+def _after(field, descending, value, pk):
+    """Rows strictly after (value, pk) in _ordering(field, descending); NULL keys sort last."""
+    id_after = Q(id__lt=pk) if descending else Q(id__gt=pk)
+    if field == "id":
+        return id_after
+    if value is None:
+        return Q(**{f"{field}__isnull": True}) & id_after
+
+    beyond = Q(**{f"{field}__lt" if descending else f"{field}__gt": value})
+    return beyond | (Q(**{field: value}) & id_after) | Q(**{f"{field}__isnull": True})
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, total_count):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.total_count = total_count
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def cached_count(queryset):
+    """
+    COUNT for a filtered listing, cached for a few minutes per distinct
+    query. Good enough for "N products" labels on infinite scroll.
+    """
+    try:
+        digest = hashlib.md5(str(queryset.query).encode()).hexdigest()
+    except Exception:
+        return queryset.count()
+
+    key = COUNT_CACHE_KEY.format(digest)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=COUNT_CACHE_TTL)
+    return count
+
+
+def keyset_paginate(queryset, sort=None, cursor=None, per_page=8,
+                    sorts=LISTING_SORTS, default=DEFAULT_SORT, with_count=True):
+    """
+    Cursor pagination keyed on (sort field, id). Each page is one
+    "WHERE key > cursor ORDER BY key LIMIT n+1" query, so deep pages cost
+    the same as the first; the total comes from cached_count. Pass
+    with_count=False when the caller already knows the total.
+    """
+    field, descending = sorts.get(sort, default)
+    total_count = cached_count(queryset.order_by()) if with_count else None
+
+    queryset, field = _keyed(queryset, field)
+    queryset = queryset.order_by(*_ordering(field, descending))
+    position = _cursor_position(queryset, field, cursor)
+    if position:
+        queryset = queryset.filter(_after(field, descending, *position))
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+
+    return KeysetPage(rows, next_cursor, total_count)
@@ -0,0 +1,133 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from product.models import Product, ProductOffer, CategoryOffer
+
+OFFER_GENERATION_KEY = "offers:generation"
+OFFER_SNAPSHOT_KEY = "offers:snapshot:{}"
+OFFER_SNAPSHOT_MAX_TTL = 60 * 60
+OFFER_PRICES_SYNCED_KEY = "offers:prices_synced_at"
+
+# per-process mirror of the redis snapshot
+_local = {"generation": None, "snapshot": None}
+
+
+def get_offer_generation():
+    generation = cache.get(OFFER_GENERATION_KEY)
+    if generation is None:
+        cache.add(OFFER_GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(OFFER_GENERATION_KEY, 1)
+    return generation
+
+
+def bump_offer_generation():
+    try:
+        cache.incr(OFFER_GENERATION_KEY)
+    except ValueError:
+        cache.add(OFFER_GENERATION_KEY, 1, timeout=None)
+        cache.incr(OFFER_GENERATION_KEY)
+    _local["generation"] = None
+    _local["snapshot"] = None
+
+
+def invalidate_offer_cache():
+    """
+    Bumps the generation once the surrounding transaction commits so that
+    readers never cache a snapshot built from uncommitted offer rows.
+    """
+    transaction.on_commit(bump_offer_generation)
+
+
+def _build_snapshot(now):
+    product_offers = defaultdict(list)
+    category_offers = defaultdict(list)
+    boundaries = [now + timedelta(seconds=OFFER_SNAPSHOT_MAX_TTL)]
+
+    for offer in ProductOffer.objects.filter(is_active=True, end_date__gte=now).order_by('id'):
+        if offer.start_date > now:
+            boundaries.append(offer.start_date)
+            continue
+        product_offers[offer.product_id].append(offer)
+        boundaries.append(offer.end_date)
+
+    for offer in CategoryOffer.objects.filter(is_active=True, end_date__gte=now).order_by('id'):
+        if offer.start_date > now:
+            boundaries.append(offer.start_date)
+            continue
+        category_offers[offer.category_id].append(offer)
+        boundaries.append(offer.end_date)
+
+    return {
+        "product": dict(product_offers),
+        "category": dict(category_offers),
+        "valid_until": min(boundaries),
+    }
+
+
+def _sync_prices_across_boundaries(now):
+    """
+    Offer saves refresh the stored effective prices through signals; this
+    catches the offers that started or ended on schedule since the last
+    snapshot build (every start/end forces one) and refreshes their products.
+    """
+    synced = cache.get(OFFER_PRICES_SYNCED_KEY)
+    cache.set(OFFER_PRICES_SYNCED_KEY, now, timeout=None)
+    if synced is None or synced >= now:
+        return
+
+    crossed = Q(start_date__gt=synced, start_date__lte=now) | Q(end_date__gte=synced, end_date__lt=now)
+    product_ids = set(ProductOffer.objects.filter(crossed, is_active=True).values_list("product_id", flat=True))
+    category_ids = CategoryOffer.objects.filter(crossed, is_active=True).values_list("category_id", flat=True)
+    product_ids.update(
+        Product.objects.all_with_deleted().filter(category_id__in=category_ids).values_list("id", flat=True)
+    )
+    if product_ids:
+        from .pricing import refresh_effective_prices
+        refresh_effective_prices(product_ids)
+
+
+def get_active_offer_snapshot():
+    """
+    Returns {"product": {product_id: [offers]}, "category": {category_id: [offers]},
+    "valid_until": datetime} for the offers running right now.
+
+    The snapshot lives in redis under the current generation and is mirrored
+    in process memory. It expires on its own at the next offer start/end,
+    and the rebuild brings the stored effective prices up to date.
+    """
+    now = timezone.now()
+    generation = get_offer_generation()
+
+    snapshot = _local["snapshot"]
+    if _local["generation"] == generation and snapshot and snapshot["valid_until"] > now:
+        return snapshot
+
+    key = OFFER_SNAPSHOT_KEY.format(generation)
+    snapshot = cache.get(key)
+
+    if not snapshot or snapshot["valid_until"] <= now:
+        _sync_prices_across_boundaries(now)
+        snapshot = _build_snapshot(now)
+        timeout = max(1, int((snapshot["valid_until"] - now).total_seconds()))
+        cache.set(key, snapshot, timeout=timeout)
+
+    _local["generation"] = generation
+    _local["snapshot"] = snapshot
+    return snapshot
+
+
+def _running(offers, now):
+    return [o for o in offers if o.start_date <= now <= o.end_date]
+
+
+def get_cached_product_offers(product_id, now=None):
+    now = now or timezone.now()
+    return _running(get_active_offer_snapshot()["product"].get(product_id, []), now)
+
+
+def get_cached_category_offers(category_id, now=None):
+    now = now or timezone.now()
+    return _running(get_active_offer_snapshot()["category"].get(category_id, []), now)
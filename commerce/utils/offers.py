@@ -1,62 +1,40 @@
+from collections import defaultdict
 from django.utils import timezone
 from decimal import Decimal
+from product.models import ProductOffer, CategoryOffer
+from .discounts import compute_discount, offer_row
+from .offer_cache import get_cached_product_offers, get_cached_category_offers
 
-def get_active_product_offer(variant):
-    now = timezone.now()
-    offers = variant.product.product_offers.filter(
-        is_active=True,
-        start_date__lte=now,
-        end_date__gte=now
-    )
-    
+def _pick_best_offer(offers, price):
     best_offer = None
     max_savings = Decimal('0.00')
 
     for offer in offers:
-        savings = calculate_effective_discount(offer, variant.sales_price)
+        savings = calculate_effective_discount(offer, price)
         if savings >= max_savings:
             max_savings = savings
             best_offer = offer
-            
+
     return best_offer
 
 
-def get_active_category_offer(variant):
-    now = timezone.now()
-    offers = variant.product.category.category_offers.filter(
-        is_active=True,
-        start_date__lte=now,
-        end_date__gte=now
-    )
-    
-    best_offer = None
-    max_savings = Decimal('0.00')
+def get_active_product_offer(variant):
+    offers = get_cached_product_offers(variant.product_id)
+    return _pick_best_offer(offers, variant.sales_price)
 
-    for offer in offers:
-        savings = calculate_effective_discount(offer, variant.sales_price)
-        if savings >= max_savings:
-            max_savings = savings
-            best_offer = offer
-            
-    return best_offer
+
+def get_active_category_offer(variant):
+    offers = get_cached_category_offers(variant.product.category_id)
+    return _pick_best_offer(offers, variant.sales_price)
 
 
 def calculate_effective_discount(offer, price):
     if not offer:
         return Decimal('0.00')
-        
-    discount_amount = (price * offer.discount_percent) / 100
-    
-    if offer.max_discount_amount and discount_amount > offer.max_discount_amount:
-        discount_amount = offer.max_discount_amount
-        
-    return discount_amount
+    return compute_discount(*offer_row(price, offer))
 
 
-def get_best_offer(variant):
-    product_offer = get_active_product_offer(variant)
-    category_offer = get_active_category_offer(variant)
-
+def _choose_between(variant, product_offer, category_offer):
     p_savings = calculate_effective_discount(product_offer, variant.sales_price)
     c_savings = calculate_effective_discount(category_offer, variant.sales_price)
 
@@ -64,19 +42,70 @@ def get_best_offer(variant):
         return product_offer
     elif c_savings > p_savings:
         return category_offer
-    
-    return None
-
 
-def get_discount_percentage(variant):
-    offer = get_best_offer(variant)
-    if not offer:
-        return 0
-
-    effective_discount = calculate_effective_discount(offer, variant.sales_price)
+    return None
 
-    if effective_discount <= 0:
-        return 0
 
-    percent = (effective_discount / variant.sales_price) * 100
-    return int(percent.quantize(Decimal("1")))
+def get_best_offer(variant):
+    product_offer = get_active_product_offer(variant)
+    category_offer = get_active_category_offer(variant)
+    return _choose_between(variant, product_offer, category_offer)
+
+
+def load_active_offers(variants, now=None):
+    """
+    Loads every active product and category offer for the given variants.
+    Returns ({product_id: [offers]}, {category_id: [offers]}).
+
+    Without an explicit `now` the offers come from the cached snapshot and
+    no query is made; otherwise at most two queries hit the database.
+    """
+    product_ids = {v.product_id for v in variants}
+    category_ids = {v.product.category_id for v in variants}
+
+    product_offers = defaultdict(list)
+    category_offers = defaultdict(list)
+
+    if now is None:
+        now = timezone.now()
+        for product_id in product_ids:
+            product_offers[product_id] = get_cached_product_offers(product_id, now)
+        for category_id in category_ids:
+            category_offers[category_id] = get_cached_category_offers(category_id, now)
+        return product_offers, category_offers
+
+    if product_ids:
+        for offer in ProductOffer.objects.filter(
+            product_id__in=product_ids,
+            is_active=True,
+            start_date__lte=now,
+            end_date__gte=now
+        ).order_by('id'):
+            product_offers[offer.product_id].append(offer)
+
+    if category_ids:
+        for offer in CategoryOffer.objects.filter(
+            category_id__in=category_ids,
+            is_active=True,
+            start_date__lte=now,
+            end_date__gte=now
+        ).order_by('id'):
+            category_offers[offer.category_id].append(offer)
+
+    return product_offers, category_offers
+
+
+def get_best_offers(variants, now=None):
+    """
+    Batch version of get_best_offer. Returns {variant_id: offer or None}.
+    """
+    variants = list(variants)
+    product_offers, category_offers = load_active_offers(variants, now=now)
+
+    best = {}
+    for variant in variants:
+        product_offer = _pick_best_offer(product_offers.get(variant.product_id, []), variant.sales_price)
+        category_offer = _pick_best_offer(category_offers.get(variant.product.category_id, []), variant.sales_price)
+        best[variant.id] = _choose_between(variant, product_offer, category_offer)
+
+    return best
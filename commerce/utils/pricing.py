@@ -1,28 +1,14 @@
 from decimal import ROUND_UP, Decimal
-from .offers import get_best_offer
+from django.utils import timezone
+from product.models import Product, ProductVariant
+from .discounts import compute_discount, compute_discounts, offer_row
+from .offers import get_best_offer, get_best_offers
+from .facets import invalidate_facets
 
-def _calculate_discount(base_price, offer):
-    if offer.discount_type == 'percentage':
-        discount = (base_price * offer.discount_percent) / Decimal(100)
-        if offer.max_discount_amount:
-            discount = min(discount, offer.max_discount_amount)
-    else:
-        discount = offer.discount_percent
-
-    return max(Decimal(0), discount)
-
-
-def get_pricing_context(variant):
+def _build_pricing_context(variant, offer, discount):
     base_price = variant.sales_price
-    best_price = base_price
-    applied_discount = Decimal(0)
-
-    offer = get_best_offer(variant)
-
-    if offer:
-        discount = _calculate_discount(base_price, offer)
-        best_price = base_price - discount
-        applied_discount = discount
+    applied_discount = discount if offer else Decimal(0)
+    best_price = base_price - applied_discount
 
     offer_percent = (
         (applied_discount / base_price) * 100
@@ -45,14 +31,39 @@ def get_pricing_context(variant):
     }
 
 
+def get_pricing_context(variant):
+    offer = get_best_offer(variant)
+    return _build_pricing_context(variant, offer, compute_discount(*offer_row(variant.sales_price, offer)))
+
+
+def get_pricing_contexts(variants, now=None):
+    """
+    Prices many variants at once. Active offers are loaded in two queries
+    no matter how many variants are passed in, and every discount goes
+    through one compute_discounts call. Returns {variant_id: pricing}.
+    """
+    variants = list(variants)
+    best_offers = get_best_offers(variants, now=now)
+    discounts = compute_discounts(
+        offer_row(v.sales_price, best_offers[v.id]) for v in variants
+    )
+    return {
+        v.id: _build_pricing_context(v, best_offers[v.id], discount)
+        for v, discount in zip(variants, discounts)
+    }
+
+
 def attach_best_pricing_to_products(products):
-    
+    products = list(products)
+    variants = [v for product in products for v in product.variants.all()]
+    pricing_map = get_pricing_contexts(variants)
+
     for product in products:
         best_pricing = None
         best_price = None
 
         for variant in product.variants.all():
-            pricing = get_pricing_context(variant)
+            pricing = pricing_map[variant.id]
 
             if best_price is None or pricing["current_price"] < best_price:
                 best_price = pricing["current_price"]
@@ -62,3 +73,41 @@ def attach_best_pricing_to_products(products):
         product.display_price = best_price
 
 
+def refresh_effective_prices(product_ids=None):
+    """
+    Recomputes ProductVariant.effective_price / effective_offer_percent and
+    Product.min_effective_price. Pass product_ids to limit the refresh.
+    Offers are read straight from the database, not from the offer cache.
+    """
+    variants = ProductVariant.objects.all_with_deleted().select_related('product')
+    products = Product.objects.all_with_deleted()
+    if product_ids is not None:
+        variants = variants.filter(product_id__in=product_ids)
+        products = products.filter(id__in=product_ids)
+
+    variants = list(variants)
+    pricing_map = get_pricing_contexts(variants, now=timezone.now())
+
+    min_prices = {}
+    for v in variants:
+        pricing = pricing_map[v.id]
+        v.effective_price = pricing["current_price"].quantize(Decimal("0.01"))
+        v.effective_offer_percent = pricing["offer_percent"]
+
+        if v.is_deleted:
+            continue
+        current = min_prices.get(v.product_id)
+        if current is None or v.effective_price < current:
+            min_prices[v.product_id] = v.effective_price
+
+    ProductVariant.objects.bulk_update(
+        variants, ['effective_price', 'effective_offer_percent'], batch_size=500
+    )
+
+    products = list(products)
+    for p in products:
+        p.min_effective_price = min_prices.get(p.id)
+    Product.objects.bulk_update(products, ['min_effective_price'], batch_size=500)
+    invalidate_facets()
+
+    return len(variants)
@@ -0,0 +1,64 @@
+import functools
+import logging
+from collections import Counter
+
+logger = logging.getLogger("commerce")
+
+# the same statement shape this many times in one request smells like N+1
+REPEAT_THRESHOLD = 3
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper hook that counts every statement, exact
+    duplicates (same SQL and params) and repeated shapes (same SQL).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.exact = Counter()
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.shapes[sql] += 1
+        try:
+            self.exact[(sql, repr(params))] += 1
+        except Exception:
+            pass
+        return execute(sql, params, many, context)
+
+    def duplicates(self):
+        return [(sql, n) for (sql, _), n in self.exact.items() if n > 1]
+
+    def repeated(self):
+        return [(sql, n) for sql, n in self.shapes.items() if n >= REPEAT_THRESHOLD]
+
+    def report(self, path, budget=None):
+        extra = {"path": path, "queries": self.count, "budget": budget}
+
+        for sql, n in self.duplicates():
+            logger.warning("Duplicate query", extra={**extra, "times": n, "sql": sql[:300]})
+        for sql, n in self.repeated():
+            logger.warning("Repeated query shape", extra={**extra, "times": n, "sql": sql[:300]})
+
+        if budget is not None and self.count > budget:
+            logger.warning("Query budget exceeded", extra=extra)
+        else:
+            logger.debug("Query count", extra=extra)
+
+
+def query_budget(limit):
+    """
+    How many queries a view may run once the caches are warm.
+    QueryBudgetMiddleware logs a warning when a request goes over and
+    product.tests fails on it. Put it above block_check, which does not
+    preserve function attributes.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(*args, **kwargs):
+            return view_func(*args, **kwargs)
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
@@ -0,0 +1,101 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Greatest
+from product.models import Category, Product, ProductVariant
+
+PRODUCT_SEARCH_CONFIG = "english"
+TRIGRAM_THRESHOLD = 0.3
+
+
+def _variant_text(field):
+    return Coalesce(
+        Subquery(
+            ProductVariant.objects.filter(product=OuterRef("pk"))
+            .order_by()
+            .values("product")
+            .annotate(text=StringAgg(field, " "))
+            .values("text")[:1]
+        ),
+        Value(""),
+        output_field=TextField(),
+    )
+
+
+def product_search_vector():
+    """
+    Weighted document for Product.search_vector: name (A), category name
+    and variant materials (B), variant descriptions (C). Built from
+    subqueries so it can be used in a plain UPDATE.
+    """
+    category_name = Subquery(
+        Category.objects.all_with_deleted().filter(pk=OuterRef("category_id")).values("name")[:1]
+    )
+    return (
+        SearchVector("name", weight="A", config=PRODUCT_SEARCH_CONFIG)
+        + SearchVector(Coalesce(category_name, Value("")), weight="B", config=PRODUCT_SEARCH_CONFIG)
+        + SearchVector(_variant_text("material_type"), weight="B", config=PRODUCT_SEARCH_CONFIG)
+        + SearchVector(_variant_text("description"), weight="C", config=PRODUCT_SEARCH_CONFIG)
+    )
+
+
+def refresh_search_vectors(product_ids=None):
+    """Rebuilds Product.search_vector in one UPDATE. Pass product_ids to limit it."""
+    products = Product.objects.all_with_deleted()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    return products.update(search_vector=product_search_vector())
+
+
+def _similarity(query, fields):
+    scores = [TrigramWordSimilarity(query, field) for field in fields]
+    return scores[0] if len(scores) == 1 else Greatest(*scores)
+
+
+def _rank_or_trigram(queryset, vector, search_query, query, trigram_fields):
+    ranked = queryset.filter(**{vector: search_query}).annotate(
+        search_rank=SearchRank(F(vector), search_query)
+    )
+    if not trigram_fields or ranked.exists():
+        return ranked.order_by("-search_rank")
+
+    # nothing matched the full-text query, most likely a typo
+    return (
+        queryset.annotate(search_rank=_similarity(query, trigram_fields))
+        .filter(search_rank__gte=TRIGRAM_THRESHOLD)
+        .order_by("-search_rank")
+    )
+
+
+def search_products(queryset, query):
+    """
+    Filters a Product queryset by the stored search_vector and orders it by
+    rank. Falls back to trigram similarity on product and category name
+    when nothing matches. Results carry a `search_rank` annotation.
+    """
+    query = (query or "").strip()
+    if not query:
+        return queryset
+    search_query = SearchQuery(query, search_type="websearch", config=PRODUCT_SEARCH_CONFIG)
+    return _rank_or_trigram(
+        queryset, "search_vector", search_query, query, ["name", "category__name"]
+    )
+
+
+def ranked_search(queryset, query, fields, trigram_fields=(), config="simple"):
+    """
+    Same ranking/fallback as search_products for models without a stored
+    vector (customers, orders). The vector is computed per query, which is
+    fine for admin-sized tables.
+    """
+    query = (query or "").strip()
+    if not query:
+        return queryset
+    search_query = SearchQuery(query, search_type="websearch", config=config)
+    queryset = queryset.annotate(document=SearchVector(*fields, config=config))
+    return _rank_or_trigram(queryset, "document", search_query, query, list(trigram_fields))
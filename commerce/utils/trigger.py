@@ -3,7 +3,7 @@ from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.contrib import messages
 
-def trigger(message, type="info", update=False, wishlist_update=False):
+def trigger(message, type="info", update=False, wishlist_update=False, counts=None):
     response = HttpResponse("") 
     
     if update or wishlist_update:
@@ -22,11 +22,14 @@ def trigger(message, type="info", update=False, wishlist_update=False):
     if wishlist_update:
         data["wishlistUpdated"] = True 
 
+    if counts is not None:
+        data["counts"] = counts
+
     response["HX-Trigger"] = json.dumps(data)
     return response
 
 
-def attach_trigger(response, message, type="info", update=False, wishlist_update=False):
+def attach_trigger(response, message, type="info", update=False, wishlist_update=False, counts=None):
     data = {
         "toast": {
             "message": message,
@@ -37,6 +40,8 @@ def attach_trigger(response, message, type="info", update=False, wishlist_update
         data["update-cart"] = True
     if wishlist_update:
         data["wishlistUpdated"] = True
+    if counts is not None:
+        data["counts"] = counts
 
     response["HX-Trigger"] = json.dumps(data)
     return response
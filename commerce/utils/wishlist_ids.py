@@ -0,0 +1,40 @@
+from django.core.cache import cache
+from django.db import transaction
+from commerce.models import WishlistItem
+
+WISHLIST_IDS_KEY = "wishlist:ids:{}"
+WISHLIST_IDS_TTL = 60 * 60 * 6
+
+# always stored alongside the variant ids: marks a complete set (an empty
+# wishlist still has a key) and is missing from a set that expired and was
+# then recreated by a single sadd
+_COMPLETE = 0
+
+
+def get_wishlist_ids(user_id):
+    """The user's wishlisted variant ids as a set; one redis read, rebuilt from the DB on a miss."""
+    if not user_id:
+        return set()
+    key = WISHLIST_IDS_KEY.format(user_id)
+    members = cache.smembers(key)
+    if _COMPLETE in members:
+        members.discard(_COMPLETE)
+        return members
+
+    ids = set(WishlistItem.objects.filter(wishlist__user_id=user_id).values_list("product_id", flat=True))
+    cache.delete(key)
+    cache.sadd(key, _COMPLETE, *ids)
+    cache.expire(key, WISHLIST_IDS_TTL)
+    return ids
+
+
+def wishlist_added(user_id, variant_id):
+    key = WISHLIST_IDS_KEY.format(user_id)
+    transaction.on_commit(lambda: cache.sadd(key, variant_id))
+
+
+def wishlist_removed(user_id, *variant_ids):
+    if not variant_ids:
+        return
+    key = WISHLIST_IDS_KEY.format(user_id)
+    transaction.on_commit(lambda: cache.srem(key, *variant_ids))
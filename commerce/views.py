@@ -2,7 +2,7 @@ from django.utils import timezone
 import logging
 from django.shortcuts import render,redirect,get_object_or_404
 from django.db import transaction
-from django.db.models import Q,Count
+from django.db.models import Q,Count,Prefetch
 from django.urls import reverse
 import json
 
@@ -15,14 +15,12 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.cache import never_cache,cache_control
 from django.core.paginator import Paginator
 from urllib.parse import urlencode
-import razorpay
 from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from commerce.services.exceptions import InsufficientWalletBalance
+from commerce.services.exceptions import InsufficientWalletBalance,InsufficientStock,InvalidPaymentSignature,PaymentGatewayError
 from commerce.services.returns import process_refund_to_wallet
 from commerce.utils.availability import check_item_availability
-from commerce.utils.offers import get_discount_percentage
 from users.decorators import block_check
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
@@ -31,7 +29,7 @@ from users.models import User,UserAddress
 from product.models import Category, Coupon, CouponUsage,Product,ProductVariant,Review
 from .utils.trigger import trigger,attach_trigger
 from decimal import Decimal
-from commerce.utils.pricing import get_pricing_context
+from commerce.utils.pricing import get_pricing_context,get_pricing_contexts
 from .utils.checkout import render_checkout_summary
 from commerce.utils.coupons import get_available_coupons, validate_and_calculate_coupon,calculate_item_coupon_share
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle,Spacer
@@ -39,6 +37,15 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from .utils.pdf_styles import get_invoice_styles
 from .services.wallet import pay_using_wallet
+from .services.cart_pricing import CartPricing
+from .services.inventory import check_available,check_checkout,give_back,restock,sell,take_units
+from .services.order_assembly import create_order_items,line_quantities
+from .services.payments import get_gateway
+from .services.recommendations import get_also_bought_for_cart
+from .services.reservations import available_to_sell,commit_holds,hold_stock,release_holds,release_user_holds,renew_hold
+from .utils.counters import adjust_cart_count,adjust_wishlist_count,reset_cart_count,get_cart_count,get_wishlist_count,header_counts
+from .utils.idempotency import derived_key,idempotent,new_idempotency_key,succeeded
+from .utils.wishlist_ids import wishlist_added,wishlist_removed
 
 logger = logging.getLogger("commerce")
 
@@ -48,17 +55,14 @@ def load_wishlist_items(request):
     wishlist_items = (
         WishlistItem.objects
         .filter(wishlist=wishlist)
-        .select_related("product", "product__product")
-        .prefetch_related(
-            "product__product__product_offers",
-            "product__product__category__category_offers",
-        )
+        .select_related("product__product__category", "product__product__primary_image")
     )
+    pricing_map = get_pricing_contexts(item.product for item in wishlist_items)
 
     wishlist_data = []
     for item in wishlist_items:
         variant = item.product
-        pricing = get_pricing_context(variant)
+        pricing = pricing_map[variant.id]
 
         wishlist_data.append({
             "variant": variant,
@@ -86,7 +90,9 @@ def toggle_wishlist(request, p_id):
     item_qs = WishlistItem.objects.filter(wishlist=wishlist, product=variant)
     
     if item_qs.exists():
-        item_qs.delete()
+        deleted, _ = item_qs.delete()
+        adjust_wishlist_count(request.user.id, -deleted)
+        wishlist_removed(request.user.id, variant.id)
         
         icon_html = '<i class="far fa-heart"></i>' 
         
@@ -95,6 +101,8 @@ def toggle_wishlist(request, p_id):
         
     else:
         WishlistItem.objects.create(wishlist=wishlist, product=variant)
+        adjust_wishlist_count(request.user.id, 1)
+        wishlist_added(request.user.id, variant.id)
         
         icon_html = '<i class="fas fa-heart text-red-500"></i>'
         
@@ -107,7 +115,8 @@ def toggle_wishlist(request, p_id):
             "message": message,
             "type": toast_type  
         },
-        "wishlistUpdated": True 
+        "wishlistUpdated": True,
+        "counts": header_counts(request.user.id),
     }
     response["HX-Trigger"] = json.dumps(header_data)
     
@@ -129,11 +138,14 @@ def move_to_cart(request, p_id):
         return cart_response
     elif hx_data["toast"]["type"]== "success":
         wishlist_item_qs = WishlistItem.objects.filter(wishlist=wishlist, product=variant)
-        wishlist_item_qs.delete()
+        deleted, _ = wishlist_item_qs.delete()
+        adjust_wishlist_count(request.user.id, -deleted)
+        wishlist_removed(request.user.id, variant.id)
         
         header_data = json.loads(cart_response["HX-Trigger"])
         
         header_data["wishlistUpdated"] = True
+        header_data["counts"] = header_counts(request.user.id)
         cart_response["HX-Trigger"] = json.dumps(header_data)
         
         return cart_response
@@ -148,11 +160,7 @@ def wishlist_count(request):
     if not request.user.is_authenticated:
         return HttpResponse("0")
 
-    wishlist, created = Wishlist.objects.get_or_create(user=request.user)
-    
-    count = wishlist.wishlist_items.count() 
-
-    return HttpResponse(count)
+    return HttpResponse(get_wishlist_count(request.user.id))
 
 
 @block_check
@@ -175,25 +183,27 @@ def add_cart_variant(request, variant_id):
 @login_required
 def add_to_cart_logic(request, product, variant):
     quantity = 1
+    available = available_to_sell([variant.id], exclude_user=request.user).get(variant.id, 0)
 
-    if variant.stock < 1:
+    if available < 1:
         return trigger("Product is out of stock.", "error")
 
     cart, _ = Cart.objects.get_or_create(user=request.user)
     item = CartItem.objects.filter(cart=cart, variant=variant).first()
 
     if item:
-        if item.quantity + quantity > variant.stock:
+        if item.quantity + quantity > available:
             return trigger("Only limited stock available.", "error")
         if item.quantity + quantity > settings.PURCHASE_QTY_LIMIT:
            return trigger(f"Cannot add more than {settings.PURCHASE_QTY_LIMIT} per order.", "error")
         
         item.quantity += quantity
         item.save()
-        return trigger("Quantity updated in cart!", "success", update=True)
+        return trigger("Quantity updated in cart!", "success", update=True, counts=header_counts(request.user.id))
 
     CartItem.objects.create(cart=cart, product=product, variant=variant, quantity=quantity)
-    return trigger("Product added to cart!", "success", update=True)
+    adjust_cart_count(request.user.id, 1)
+    return trigger("Product added to cart!", "success", update=True, counts=header_counts(request.user.id))
 
 @block_check
 @login_required
@@ -201,46 +211,43 @@ def add_to_cart_logic(request, product, variant):
 def cart_page(request):
 
     cart, _ = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.select_related("product", "variant").all()
     deleted_items=cart.items.filter(Q(product__is_deleted=True)|Q(variant__is_deleted=True)|Q(product__category__is_deleted=True))
     if deleted_items.exists():
         deleted_items.delete()
+        reset_cart_count(request.user.id)
         messages.error(request,"Some items in your cart are no longer availabe and were removed.")
         return redirect("cart_page")
 
+    cart_pricing = CartPricing.for_request(request, cart)
     validation_required = False
+    available = available_to_sell([item.variant_id for item in cart_pricing.items], exclude_user=request.user)
     
-    for item in list(cart_items): 
+    for item in cart_pricing.items: 
+        stock = available.get(item.variant_id, 0)
         
-        if item.variant.stock == 0:
+        if stock == 0:
             item.delete()
+            adjust_cart_count(request.user.id, -1)
             messages.error(request, f"'{item.product.name}-({item.variant.material_type})' is now out of stock.Removed from your cart!")
             validation_required = True
             
-        elif item.quantity > item.variant.stock:
+        elif item.quantity > stock:
             old_quantity = item.quantity
-            item.quantity = item.variant.stock
+            item.quantity = stock
             item.save()
             messages.warning(request, 
-                f"Quantity reduced! for '{item.product.name}'. Max available stock is now {item.variant.stock}."
+                f"Quantity reduced! for '{item.product.name}'. Max available stock is now {stock}."
             )
             validation_required = True
             
     
     if validation_required:
         return redirect('cart_page')
-    for item in cart_items:
-        item.offer_percent=get_discount_percentage(item.variant)
-        price=Decimal(item.variant.sales_price)
-        if item.offer_percent>0:
-            item.discounted_price=price-(price* Decimal(item.offer_percent)/100)
-            item.offer_percent=round(item.offer_percent)
-        else:
-            item.discounted_price=price
 
     return render(request, "commerce/cart/cart_page.html", {
         "cart": cart,
-        "cart_items": cart_items,
+        "cart_items": cart_pricing.items,
+        "also_bought": get_also_bought_for_cart(cart_pricing.items),
     })
 
 # for product details page
@@ -256,7 +263,8 @@ def stock_status_for_variant(request, variant_id):
 
     max_addable_qty = settings.PURCHASE_QTY_LIMIT
     
-    remaining_stock_in_db = variant.stock - in_cart_qty
+    stock = available_to_sell([variant.id], exclude_user=request.user).get(variant.id, 0)
+    remaining_stock_in_db = stock - in_cart_qty
     remaining_stock_to_add = max_addable_qty - in_cart_qty
     
     available_to_add = max(0, min(remaining_stock_in_db, remaining_stock_to_add))
@@ -265,7 +273,7 @@ def stock_status_for_variant(request, variant_id):
         'variant': variant,
         'in_cart_qty': in_cart_qty,
         'available_to_add': available_to_add,
-        'total_stock': variant.stock, 
+        'total_stock': stock, 
     }   
     return render(request, "commerce/product/_stock_status.html", context)
 
@@ -275,12 +283,13 @@ def stock_status_for_variant(request, variant_id):
 def increase_quantity(request, item_id):
 
     item = get_object_or_404(
-        CartItem.objects.select_related("product", "variant", "cart"),
+        CartItem.objects.select_related("product__primary_image", "variant__product", "cart"),
         id=item_id,
         cart__user=request.user
     )
 
-    if item.quantity < item.variant.stock and item.quantity < settings.PURCHASE_QTY_LIMIT:
+    stock = available_to_sell([item.variant_id], exclude_user=request.user).get(item.variant_id, 0)
+    if item.quantity < stock and item.quantity < settings.PURCHASE_QTY_LIMIT:
         item.quantity += 1
         item.save()
         message="Quantity Increased."
@@ -290,15 +299,9 @@ def increase_quantity(request, item_id):
         "toast": {"message": message, "type": "info"},
         "update-cart": True 
     }
-    item.offer_percent = get_discount_percentage(item.variant)
-
-    price = Decimal(item.variant.sales_price)
-    if item.offer_percent > 0:
-        item.discounted_price = price - (price * Decimal(item.offer_percent) / 100)
-        item.offer_percent=round(item.offer_percent)
-
-    else:
-        item.discounted_price = price
+    pricing = get_pricing_context(item.variant)
+    item.offer_percent = pricing["offer_percent"]
+    item.discounted_price = pricing["current_price"]
     response = render(request, "commerce/cart/_cart_item.html", {
         "item": item
     })
@@ -310,7 +313,7 @@ def increase_quantity(request, item_id):
 @login_required
 def decrease_quantity(request, item_id):
     item = get_object_or_404(
-        CartItem.objects.select_related("product", "variant", "cart"),
+        CartItem.objects.select_related("product__primary_image", "variant__product", "cart"),
         id=item_id,
         cart__user=request.user
     )
@@ -325,14 +328,9 @@ def decrease_quantity(request, item_id):
         "toast": {"message": message, "type": "warning"},
         "update-cart": True 
     }
-    item.offer_percent = get_discount_percentage(item.variant)
-
-    price = Decimal(item.variant.sales_price)
-    if item.offer_percent > 0:
-        item.discounted_price = price - (price * Decimal(item.offer_percent) / 100)
-        item.offer_percent=round(item.offer_percent)
-    else:
-        item.discounted_price = price
+    pricing = get_pricing_context(item.variant)
+    item.offer_percent = pricing["offer_percent"]
+    item.discounted_price = pricing["current_price"]
     response = render(request, "commerce/cart/_cart_item.html", {
         "item": item
     })
@@ -350,16 +348,16 @@ def remove_cart_item(request,item_id):
         id=item_id,
         cart__user=request.user
     )  
-    cart = item.cart if item else None
+    item.delete()
+    adjust_cart_count(request.user.id, -1)
 
-    if item:
-        item.delete()
-    if cart.items.count()==0:
+    counts = header_counts(request.user.id)
+    if counts["cart"]==0:
         response=HttpResponse("")
         response["HX-Location"]=reverse("cart_page")
         return response
     response = HttpResponse("")    
-    response["HX-Trigger"] = "update-cart"
+    response["HX-Trigger"] = json.dumps({"update-cart": True, "counts": counts})
     return response
 
 @block_check
@@ -368,10 +366,7 @@ def cart_count(request):
     if not request.user.is_authenticated:
         return HttpResponse("0")  
 
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    count = cart.items.count()
-
-    return HttpResponse(count)
+    return HttpResponse(get_cart_count(request.user.id))
 
 @block_check
 @login_required
@@ -379,39 +374,15 @@ def cart_totals(request):
     if not request.user.is_authenticated:
         return HttpResponse("")
 
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    items = cart.items.select_related("variant", "product")
-    if not items.exists():
+    cart_pricing = CartPricing.for_request(request)
+    if cart_pricing.is_empty:
         return HttpResponse("")
 
-    subtotal =Decimal(0)
-    discount = Decimal(0)
-    for i in items:
-        if not i.variant or i.variant.sales_price is None:
-            continue
-
-        price = Decimal(i.variant.sales_price)
-        offer_percent = get_discount_percentage(i.variant)
-
-        if offer_percent:
-            discounted_price = price - (price * Decimal(offer_percent) / 100)
-            discount += (price - discounted_price) * i.quantity
-        else:
-            discounted_price = price
-
-        subtotal += discounted_price * i.quantity
-
-    if subtotal ==Decimal(0):
-        shipping_cost=Decimal("0")
-    else:
-        shipping_cost = Decimal("0") if subtotal >= 1000 else Decimal("80")
-    total = subtotal + shipping_cost
-
     context = {
-        "subtotal": subtotal,
-        "shipping_cost": shipping_cost,
-        "discount": discount,
-        "total": total,
+        "subtotal": cart_pricing.subtotal,
+        "shipping_cost": cart_pricing.shipping_cost,
+        "discount": cart_pricing.offer_discount,
+        "total": cart_pricing.total(),
     }
 
     return render(request, "commerce/cart/_cart_totals.html", context)
@@ -424,7 +395,8 @@ def checkout(request):
     user=request.user
     cart,_=Cart.objects.get_or_create(user=user)
     
-    products=cart.items.select_related("variant",'product')
+    cart_pricing = CartPricing.for_request(request, cart)
+    products = cart_pricing.items
     for item in products:
         is_available, error = check_item_availability(item)
 
@@ -432,26 +404,20 @@ def checkout(request):
             messages.error(request, error)
             return redirect("products")
     
-    if not products.exists():
+    if cart_pricing.is_empty:
         messages.error(request,"Your cart is empty!")
         return redirect('cart_page')
     
     addresses=user.addresses.filter(is_deleted=False)
     has_address=addresses.exists()
-    subtotal = Decimal("0")
-    offer_discount = Decimal("0")
+    # the figure place_order checks: stock less other shoppers' holds
+    try:
+        check_available(line_quantities((item.variant_id, item.quantity) for item in products), user)
+    except InsufficientStock:
+        return redirect("cart_page")
 
-    for item in products:
-        if item.quantity>item.variant.stock:
-            # messages.error(request,f"{item.product.name}-({item.variant.material_type}) is get out of stock!")
-            return redirect("cart_page")
-        else:
-            price = Decimal(item.variant.sales_price)
-            offer_percent = get_discount_percentage(item.variant)
-            item.offer_percent=offer_percent
-            item.discounted_price = price - (price * Decimal(offer_percent) / 100)
-            subtotal += item.discounted_price * item.quantity
-            offer_discount += (price - item.discounted_price) * item.quantity
+    subtotal = cart_pricing.subtotal
+    offer_discount = cart_pricing.offer_discount
     
     coupon_code=request.session.get('applied_coupon')
     coupon_discount=Decimal('0')
@@ -464,11 +430,9 @@ def checkout(request):
             coupon = None
             coupon_discount = Decimal("0")
 
-    shipping_cost= 0 if subtotal>=1000 else 80
-    total = subtotal -coupon_discount + shipping_cost
-    now = timezone.now()
-    MAX_COD_AMOUNT = Decimal("1000")
-    cod_allowed = total <= MAX_COD_AMOUNT
+    shipping_cost = cart_pricing.shipping_cost
+    total = cart_pricing.total(coupon_discount)
+    cod_allowed = cart_pricing.cod_allowed(coupon_discount)
 
     
     available_coupons = get_available_coupons(user=user,subtotal=subtotal)
@@ -486,6 +450,7 @@ def checkout(request):
         "total":total,
         "cod_allowed": cod_allowed,
         "available_coupons": available_coupons,
+        "idempotency_key": new_idempotency_key(),
     }
     return render(request,'commerce/checkout/checkout_page.html',context)
 
@@ -505,17 +470,11 @@ def apply_coupon(request):
     user = request.user
     
     cart = Cart.objects.filter(user=user).first()
-    if not cart or not cart.items.exists():
+    cart_pricing = CartPricing.for_request(request, cart) if cart else None
+    if not cart_pricing or cart_pricing.is_empty:
          return render_checkout_summary(request, error_message="Your cart is empty.")
 
-    subtotal = Decimal("0.00")
-    for item in cart.items.select_related("variant"):
-        price = Decimal(item.variant.sales_price)
-        offer_percent = get_discount_percentage(item.variant) or 0
-        discounted_price = price - (price * Decimal(offer_percent) / 100)
-        subtotal += discounted_price * item.quantity
-
-    coupon, discount, error = validate_and_calculate_coupon(coupon_code, user, subtotal)
+    coupon, discount, error = validate_and_calculate_coupon(coupon_code, user, cart_pricing.subtotal)
 
     if error:
         request.session.pop("applied_coupon", None)
@@ -544,7 +503,39 @@ def remove_coupon(request):
     messages.info(request, "Coupon removed.")
     return redirect("checkout")
 
+def _checkout_key(request):
+    key = request.POST.get("idempotency_key") or request.headers.get("Idempotency-Key")
+    return f"{request.user.id}:{key}" if key else None
+
+
+def _order_placed(response):
+    """Redirects back to checkout or the cart carry a flash message; the shopper may retry them."""
+    return succeeded(response) and response.get("Location") not in (reverse("checkout"), reverse("cart_page"))
+
+
+def _payment_payload(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _payment_success_key(request):
+    data = _payment_payload(request)
+    parts = [data.get(f) for f in ("razorpay_order_id", "razorpay_payment_id", "razorpay_signature")]
+    return derived_key(*parts) if all(parts) else None
+
+
+def _payment_failed_key(request):
+    data = _payment_payload(request)
+    if not data.get("order_id"):
+        return None
+    return derived_key(data["order_id"], data.get("razorpay_order_id", ""))
+
+
 @login_required
+@idempotent("place_order", _checkout_key, final=_order_placed)
 def place_order(request):
     if request.method != "POST":
         return redirect("checkout")
@@ -552,7 +543,11 @@ def place_order(request):
     if not request.POST.get("address"):
         messages.error(request, "Please select an address.")
         return redirect("checkout")
-    
+
+    payment_method = request.POST.get("payment_method")
+    if payment_method not in dict(Orders.PAYMENT_METHODS):
+        messages.error(request, "Please select a payment method.")
+        return redirect("checkout")
 
     user = request.user
     cart, _ = Cart.objects.get_or_create(user=user)
@@ -564,13 +559,13 @@ def place_order(request):
         return redirect("checkout")
 
     with transaction.atomic():
-        items = (
+        items = list(
             cart.items
-            .select_related("variant", "product")
-            .select_for_update()
+            .select_related("variant__product__category", "product__primary_image")
+            .select_for_update(of=("self",))
         )
 
-        if not items.exists():
+        if not items:
             messages.error(request, "Your cart is empty!")
             return redirect("cart_page")
 
@@ -580,32 +575,21 @@ def place_order(request):
             user=user
         )
 
-        payment_method = request.POST.get("payment_method")
-
-        #  STOCK VALIDATION 
-        for item in items:
-            if item.variant.stock == 0:
-                request.session.pop("applied_coupon", None)
-                return redirect("cart_page")
-            elif item.quantity > item.variant.stock:
-                request.session.pop("applied_coupon", None)
-                messages.error(
-                    request,
-                    f"Only {item.variant.stock} left for {item.variant.material_type}."
-                )
-                return redirect("cart_page")
+        #  STOCK VALIDATION: see commerce.services.inventory
+        quantities = line_quantities((item.variant_id, item.quantity) for item in items)
+        try:
+            check_checkout(quantities, user)
+        except InsufficientStock as e:
+            request.session.pop("applied_coupon", None)
+            if e.available:
+                material = next(i.variant.material_type for i in items if i.variant_id == e.variant_id)
+                messages.error(request, f"Only {e.available} left for {material}.")
+            return redirect("cart_page")
 
         # PRICE CALCULATION 
-        subtotal = Decimal("0")
-        offer_discount = Decimal("0")
-
-        for item in items:
-            unit_price = Decimal(item.variant.sales_price)
-            offer_percent = get_discount_percentage(item.variant)
-            discounted_price = unit_price - (unit_price * Decimal(offer_percent) / 100)
-
-            subtotal += discounted_price * item.quantity
-            offer_discount += (unit_price - discounted_price) * item.quantity
+        cart_pricing = CartPricing(cart, items)
+        subtotal = cart_pricing.subtotal
+        offer_discount = cart_pricing.offer_discount
 
         coupon = None
         coupon_discount = Decimal("0")
@@ -619,20 +603,29 @@ def place_order(request):
                 coupon = None
                 coupon_discount = Decimal("0")
 
-        delivery_charge = 0 if subtotal >= 1000 else 80
-        total = subtotal - coupon_discount + delivery_charge
+        delivery_charge = cart_pricing.shipping_cost
+        total = cart_pricing.total(coupon_discount)
 
         if payment_method == "wallet":
             wallet=Wallet.objects.filter(user=user).first()
             if not wallet or wallet.balance<total:  
                 messages.error(request, "Insufficient wallet balance.")
                 return redirect("checkout") 
-        if payment_method == "cod" and total > Decimal("1000"):
+        if payment_method == "cod" and not cart_pricing.cod_allowed(coupon_discount):
             messages.error(
                 request,
                 "Cash on Delivery is not available for orders above ₹1000."
             )
             return redirect("checkout")
+
+        # this order replaces any unpaid Razorpay order of the shopper
+        released = release_user_holds(user)
+        try:
+            take_units(quantities, reuse=released)
+        except InsufficientStock:
+            give_back(released)
+            messages.error(request, "Some items in your cart just sold out.")
+            return redirect("cart_page")
         
         order = Orders.objects.create(
             user=user,
@@ -648,19 +641,7 @@ def place_order(request):
             payment_status="pending"
         )
 
-        for item in items:
-            unit_price = Decimal(item.variant.sales_price)
-            offer_percent = get_discount_percentage(item.variant)
-            final_price = unit_price - (unit_price * Decimal(offer_percent) / 100)
-
-            OrderItem.objects.create(
-                order=order,
-                product=item.variant,
-                quantity=item.quantity,
-                unit_price=unit_price,
-                price=final_price * item.quantity,
-                offer_percent=offer_percent
-            )
+        create_order_items(order, cart_pricing.items)
         
         if coupon:
             usage_count = coupon.usages.filter(user=user).count()
@@ -682,15 +663,14 @@ def place_order(request):
             try:
                 pay_using_wallet(user=user, order=order, amount=total)
             except InsufficientWalletBalance:
+                give_back(quantities)
                 messages.error(request, "Insufficient wallet balance.")
                 return redirect("checkout") 
 
             # reduce stock + clear cart
-            for item in items:
-                item.variant.stock -= item.quantity
-                item.variant.save(update_fields=["stock"])
-
-            items.delete()
+            sell(quantities, order)
+            cart.items.all().delete()
+            reset_cart_count(user.id)
             request.session.pop("checkout_cart_update_at", None)
             request.session.pop("applied_coupon", None)
             request.session["just_completed_order"] = order.order_id
@@ -699,11 +679,9 @@ def place_order(request):
             return redirect("order_success", order_id=order.order_id)
 
         if payment_method == "cod":
-            for item in items:
-                item.variant.stock -= item.quantity
-                item.variant.save(update_fields=["stock"])
-
-            items.delete()
+            sell(quantities, order)
+            cart.items.all().delete()
+            reset_cart_count(user.id)
             order.payment_status = "pending"
             order.save(update_fields=["payment_status"])
 
@@ -715,6 +693,7 @@ def place_order(request):
             return redirect("order_success", order_id=order.order_id)
 
         if payment_method == "razorpay":
+            hold_stock(order, quantities)
             return redirect("razorpay_start", order_id=order.order_id)
 
     return redirect("checkout")
@@ -730,15 +709,18 @@ def start_razorpay_payment(request, order_id):
     if order.payment_status == "paid":
         return redirect("order_success", order_id=order.order_id)
 
-    client = razorpay.Client(
-        auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-    )
+    try:
+        with transaction.atomic():
+            renew_hold(order)
+    except InsufficientStock:
+        messages.error(request, "Some items in this order are no longer in stock.")
+        return redirect("user_order_detail", order_id=order.order_id)
 
-    razorpay_order = client.order.create({
-        "amount": int(order.total_price * 100),
-        "currency": "INR",
-        "payment_capture": 1
-    })
+    try:
+        razorpay_order = get_gateway().create_order(order.total_price)
+    except PaymentGatewayError:
+        messages.error(request, "We couldn't reach the payment gateway. Please try again.")
+        return redirect("user_order_detail", order_id=order.order_id)
 
     order.razorpay_order_id = razorpay_order["id"]
     order.payment_status = "pending"
@@ -750,56 +732,154 @@ def start_razorpay_payment(request, order_id):
         "razorpay_order_id": razorpay_order["id"],
     })
 
+def _cancel_unsellable(order, data, captured):
+    """
+    The order's stock was gone by the time its payment came in. A captured
+    payment is recorded and credited to the shopper's wallet, the way a
+    cancelled paid order is refunded; an authorized one is never captured,
+    so Razorpay voids it. Either way the order ends up cancelled. Returns
+    False when a concurrent callback settled the order first.
+    """
+    with transaction.atomic():
+        order = Orders.objects.select_for_update().get(pk=order.pk)
+        if order.payment_status not in ("pending", "failed"):
+            return False
+        release_holds(order)
+        order.items.exclude(status="cancelled").update(
+            status="cancelled",
+            cancellation_reason="Out of stock when the payment came in",
+        )
+        if captured:
+            order.payment_method = "razorpay"
+            order.razorpay_payment_id = data["razorpay_payment_id"]
+            order.razorpay_signature = data["razorpay_signature"]
+            process_refund_to_wallet(order, order.original_total, source="order_cancel")
+            order.payment_status = "refunded"
+        else:
+            order.payment_status = "cancelled"
+        order.total_price = Decimal("0.00")
+        order.save(update_fields=[
+            "payment_status",
+            "payment_method",
+            "razorpay_payment_id",
+            "razorpay_signature",
+            "total_price",
+        ])
+    logger.error(
+        "Razorpay order %s cancelled: out of stock at payment (payment %s, captured=%s)",
+        order.order_id, data["razorpay_payment_id"], captured,
+    )
+    return True
+
+
+def _unsellable_response(request, order, captured):
+    if captured:
+        messages.error(request, "Some items sold out before your payment came in. The amount was refunded to your wallet.")
+    else:
+        messages.error(request, "Some items sold out before your payment came in. You have not been charged.")
+    return JsonResponse({
+        "success": False,
+        "redirect": reverse("user_order_detail", args=[order.order_id]),
+    }, status=409)
+
+
+def _settled_elsewhere(order, data, charged):
+    """
+    A concurrent callback settled the order first. A payment of ours that
+    was charged but is not the one on the order goes back to the shopper.
+    """
+    order.refresh_from_db(fields=["payment_status", "razorpay_payment_id"])
+    if charged and order.razorpay_payment_id != data["razorpay_payment_id"]:
+        try:
+            get_gateway().refund_payment(data["razorpay_payment_id"], order.original_total)
+        except PaymentGatewayError:
+            logger.error(
+                "Duplicate payment %s on order %s needs a manual refund",
+                data["razorpay_payment_id"], order.order_id,
+            )
+    if order.payment_status == "paid":
+        return JsonResponse({"success": True})
+    return JsonResponse({"success": False}, status=409)
+
+
 @csrf_exempt
 @never_cache    
+@idempotent("razorpay_success", _payment_success_key)
 def razorpay_success(request):
     data = json.loads(request.body)
-
-    client = razorpay.Client(
-        auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-    )
+    gateway = get_gateway()
 
     try:
-        client.utility.verify_payment_signature({
-            "razorpay_order_id": data["razorpay_order_id"],
-            "razorpay_payment_id": data["razorpay_payment_id"],
-            "razorpay_signature": data["razorpay_signature"],
-        })
-
-        with transaction.atomic():
-            order = Orders.objects.select_for_update().get(
-                Q(payment_status="pending") | Q(payment_status="failed"),
-                razorpay_order_id=data["razorpay_order_id"],
-            )            
-            if not request.user.is_authenticated or order.user_id != request.user.id:
-                raise PermissionDenied
-
-            payment = client.payment.fetch(data["razorpay_payment_id"])
-            if payment["status"] == "authorized":
-                client.payment.capture(
-                    data["razorpay_payment_id"],
-                    int(order.total_price * 100)
-                )
-
-            for item in order.items.select_related("product"):
-                if item.quantity > item.product.stock:
-                    raise ValueError("Stock mismatch during Razorpay success")
-
-                item.product.stock -= item.quantity
-                item.product.save(update_fields=["stock"])
+        gateway.verify_signature(
+            data["razorpay_order_id"],
+            data["razorpay_payment_id"],
+            data["razorpay_signature"],
+        )
 
-            CartItem.objects.filter(cart__user=order.user).delete()
+        # replay after the idempotency entry expired: the order row says it all
+        if Orders.objects.filter(
+            razorpay_order_id=data["razorpay_order_id"],
+            razorpay_payment_id=data["razorpay_payment_id"],
+            payment_status="paid",
+        ).exists():
+            return JsonResponse({"success": True})
+
+        unpaid = Orders.objects.filter(
+            Q(payment_status="pending") | Q(payment_status="failed"),
+            razorpay_order_id=data["razorpay_order_id"],
+        )
+        order = unpaid.get()
+        if not request.user.is_authenticated or order.user_id != request.user.id:
+            raise PermissionDenied
+
+        # gateway calls happen before the row lock is taken
+        payment = gateway.fetch_payment(data["razorpay_payment_id"])
+        captured = payment["status"] == "captured"
+
+        # the hold may have expired while the shopper was paying: secure the
+        # stock before charging anything
+        try:
+            with transaction.atomic():
+                renew_hold(order)
+        except InsufficientStock:
+            if not _cancel_unsellable(order, data, captured):
+                return _settled_elsewhere(order, data, charged=captured)
+            return _unsellable_response(request, order, captured)
+
+        if not captured:
+            # a concurrent callback may have settled the order meanwhile
+            if not unpaid.exists():
+                return _settled_elsewhere(order, data, charged=False)
+            gateway.capture_payment(data["razorpay_payment_id"], order.total_price)
+
+        try:
+            with transaction.atomic():
+                order = unpaid.select_for_update().get()
+
+                held = order.reservations.filter(status="active").exists()
+                sell(line_quantities(order.items.values_list("product_id", "quantity")), order, admitted=held)
+                commit_holds(order)
+
+                CartItem.objects.filter(cart__user=order.user).delete()
+                reset_cart_count(order.user_id)
+
+                order.payment_status = "paid"
+                order.payment_method = "razorpay"
+                order.razorpay_payment_id = data["razorpay_payment_id"]
+                order.razorpay_signature = data["razorpay_signature"]
+                order.save(update_fields=[
+                    "payment_status",
+                    "payment_method",
+                    "razorpay_payment_id",
+                    "razorpay_signature"
+                ])
+        except Orders.DoesNotExist:
+            return _settled_elsewhere(order, data, charged=True)
+        except InsufficientStock:
+            if not _cancel_unsellable(order, data, captured=True):
+                return _settled_elsewhere(order, data, charged=True)
+            return _unsellable_response(request, order, captured=True)
 
-            order.payment_status = "paid"
-            order.payment_method = "razorpay"
-            order.razorpay_payment_id = data["razorpay_payment_id"]
-            order.razorpay_signature = data["razorpay_signature"]
-            order.save(update_fields=[
-                "payment_status",
-                "payment_method",
-                "razorpay_payment_id",
-                "razorpay_signature"
-            ])
         request.session.pop("applied_coupon", None)
         request.session.pop("checkout_cart_update_at", None)
         request.session["just_completed_order"] = order.order_id
@@ -808,15 +888,19 @@ def razorpay_success(request):
     except Orders.DoesNotExist:
         return JsonResponse({"success": False}, status=404)
 
-    except razorpay.errors.SignatureVerificationError:
+    except InvalidPaymentSignature:
         return JsonResponse({"success": False}, status=400)
 
+    except PaymentGatewayError:
+        return JsonResponse({"success": False}, status=502)
+
     except Exception as e:
         logger.exception("Razorpay success processing failed")
         return JsonResponse({"success": False}, status=500)
 
 @csrf_exempt
 @never_cache
+@idempotent("razorpay_failed", _payment_failed_key)
 def razorpay_failed(request):
     logger.error("razorpay_failed view HIT")
     data = json.loads(request.body)
@@ -828,10 +912,12 @@ def razorpay_failed(request):
         )
         order.payment_status = "failed"
         order.save(update_fields=["payment_status"])
+        release_holds(order)
 
         request.session["just_completed_order"] = order.order_id
 
         CartItem.objects.filter(cart__user=order.user).delete()
+        reset_cart_count(order.user_id)
         request.session.pop("applied_coupon", None)
         return JsonResponse({"success": True})
 
@@ -865,7 +951,9 @@ def order_success(request,order_id):
     request.session.pop("just_completed_order", None)
 
     order=get_object_or_404(
-        Orders.objects.select_related("address").prefetch_related("items__product"),
+        Orders.objects.select_related("address").prefetch_related(
+            Prefetch("items", queryset=OrderItem.objects.select_related("product__product__primary_image"))
+        ),
         order_id=order_id,
         user=request.user
     )
@@ -875,7 +963,9 @@ def order_success(request,order_id):
 @login_required
 @never_cache
 def my_orders(request):
-    orders=Orders.objects.filter(user=request.user).order_by("-created_at")
+    orders=Orders.objects.filter(user=request.user).prefetch_related(
+        Prefetch("items", queryset=OrderItem.objects.select_related("product__product__primary_image"))
+    ).order_by("-created_at")
     paginator = Paginator(orders, 3)  
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
@@ -893,7 +983,7 @@ def my_orders(request):
 @never_cache
 def user_order_detail(request, order_id):
     order = get_object_or_404(Orders, order_id=order_id, user=request.user)
-    items = order.items.select_related("product", "product__product").prefetch_related("return_items")
+    items = order.items.select_related("product__product__primary_image").prefetch_related("return_items")
 
     for item in items:
         return_obj=item.return_items.first()
@@ -966,8 +1056,7 @@ def cancel_order_item(request,item_id):
             item.status="cancelled"
             item.save(update_fields=["status"])
 
-            item.product.stock+=item.quantity
-            item.product.save(update_fields=['stock'])
+            restock({item.product_id: item.quantity}, "cancel", order)
 
             if order.payment_status in ['paid','partially_refunded']:
 
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from commerce.services.inventory import compact_stock, reseed_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold pending StockMovement rows into ProductVariant.stock. Only "
+        "needed with INVENTORY_LEDGER on; schedule it every minute or so. "
+        "--reseed also drops the redis admission counters so they are "
+        "re-seeded from the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--reseed", action="store_true", help="Re-seed the admission counters afterwards.")
+
+    def handle(self, *args, **options):
+        count = compact_stock(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Compacted {count} stock movements."))
+        if options["reseed"]:
+            reseed_counters()
+            self.stdout.write(self.style.SUCCESS("Admission counters will be re-seeded on next use."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from product.models import ProductRatingSummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild ProductRatingSummary rows from the reviews table. Run once "
+        "after migrating; new and deleted reviews update it incrementally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only rebuild the given product id (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        count = ProductRatingSummary.objects.rebuild(options["product_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating summaries for {count} products."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from commerce.utils.search import refresh_search_vectors
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild Product.search_vector from product, category and variant "
+        "text. Run once after migrating; edits keep it current on save."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only rebuild the given product id (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_search_vectors(options["product_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search vectors for {count} products."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from commerce.utils.pricing import refresh_effective_prices
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the materialized effective price of every variant and the "
+        "min effective price of every product. Offer and variant edits refresh "
+        "on save and offers starting or ending are caught when the offer "
+        "snapshot is rebuilt; this is a full resync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only refresh the given product id (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_effective_prices(options["product_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed effective prices for {count} variants."))
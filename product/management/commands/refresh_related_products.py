@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from commerce.services.recommendations import refresh_related_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the top related products of every product from category, "
+        "material overlap and co-purchase history. Schedule this nightly; "
+        "product_details only reads the stored ranking."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Only refresh the given product id (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_related_products(options["product_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} related product rows."))
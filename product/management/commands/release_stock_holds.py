@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from commerce.services.reservations import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Release stock holds of unpaid Razorpay orders whose hold period "
+        "(STOCK_HOLD_MINUTES) has passed. Expired holds already stop counting "
+        "against available stock; schedule this every few minutes to keep "
+        "the active set small."
+    )
+
+    def handle(self, *args, **options):
+        count = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Released {count} expired stock holds."))
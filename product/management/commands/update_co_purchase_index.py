@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from commerce.services.co_purchase import BATCH_SIZE, TOP_N, update_co_purchase_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold newly delivered orders into the co-purchase index and refresh "
+        "each affected product's top neighbours. Resumes from the last "
+        "processed order; schedule it before refresh_related_products."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Drop the index and start from the first order.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Orders per committed batch.")
+        parser.add_argument("--top", type=int, default=TOP_N, help="Neighbours kept per product.")
+
+    def handle(self, *args, **options):
+        count = update_co_purchase_index(
+            batch_size=options["batch_size"],
+            top_n=options["top"],
+            rebuild=options["rebuild"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} orders into the co-purchase index."))
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+from collections import defaultdict
+from decimal import ROUND_UP, Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_effective_prices(apps, schema_editor):
+    # same rules as commerce.utils.pricing.refresh_effective_prices
+    from commerce.utils.discounts import compute_discount
+
+    Product = apps.get_model('product', 'Product')
+    ProductVariant = apps.get_model('product', 'ProductVariant')
+    ProductOffer = apps.get_model('product', 'ProductOffer')
+    CategoryOffer = apps.get_model('product', 'CategoryOffer')
+
+    now = timezone.now()
+    running = dict(is_active=True, start_date__lte=now, end_date__gte=now)
+    product_offers = defaultdict(list)
+    for offer in ProductOffer.objects.filter(**running).order_by('id'):
+        product_offers[offer.product_id].append(offer)
+    category_offers = defaultdict(list)
+    for offer in CategoryOffer.objects.filter(**running).order_by('id'):
+        category_offers[offer.category_id].append(offer)
+
+    def best_discount(offers, price):
+        best = Decimal('0.00')
+        for offer in offers:
+            best = max(best, compute_discount(price, offer.discount_percent, offer.max_discount_amount, offer.discount_type))
+        return best
+
+    variants = list(ProductVariant.objects.select_related('product'))
+    min_prices = {}
+    for v in variants:
+        discount = max(
+            best_discount(product_offers[v.product_id], v.sales_price),
+            best_discount(category_offers[v.product.category_id], v.sales_price),
+        )
+        v.effective_price = max(Decimal(0), v.sales_price - discount).quantize(Decimal('0.01'))
+        percent = discount / v.sales_price * 100 if v.sales_price > 0 and discount > 0 else Decimal(0)
+        v.effective_offer_percent = int(max(Decimal(1), percent.quantize(0, rounding=ROUND_UP))) if percent > 0 else 0
+        if not v.is_deleted:
+            current = min_prices.get(v.product_id)
+            if current is None or v.effective_price < current:
+                min_prices[v.product_id] = v.effective_price
+    ProductVariant.objects.bulk_update(variants, ['effective_price', 'effective_offer_percent'], batch_size=500)
+
+    products = list(Product.objects.all())
+    for p in products:
+        p.min_effective_price = min_prices.get(p.id)
+    Product.objects.bulk_update(products, ['min_effective_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0024_rename_discount_value_categoryoffer_discount_percent_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='min_effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='effective_offer_percent',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['min_effective_price'], name='product_pro_min_eff_59f436_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'min_effective_price'], name='product_pro_categor_603fd1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=models.Index(fields=['product', 'effective_price'], name='product_pro_product_afe4e2_idx'),
+        ),
+        migrations.RunPython(backfill_effective_prices, migrations.RunPython.noop),
+    ]
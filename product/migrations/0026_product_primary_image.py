@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_primary_image(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    ProductImage = apps.get_model('product', 'ProductImage')
+
+    for product in Product.objects.all().iterator():
+        image = (
+            ProductImage.objects.filter(product_id=product.id, is_deleted=False)
+            .order_by('-is_primary', '-id')
+            .first()
+        )
+        if image:
+            Product.objects.filter(id=product.id).update(primary_image=image)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0025_product_min_effective_price_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='product.productimage'),
+        ),
+        migrations.RunPython(backfill_primary_image, migrations.RunPython.noop),
+    ]
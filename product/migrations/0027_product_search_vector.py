@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# same document as commerce.utils.search.product_search_vector
+BACKFILL_SEARCH_VECTOR = """
+UPDATE product_product p SET search_vector =
+    setweight(to_tsvector('english'::regconfig, COALESCE(p.name, '')), 'A')
+    || setweight(to_tsvector('english'::regconfig, COALESCE(
+        (SELECT c.name FROM product_category c WHERE c.id = p.category_id), '')), 'B')
+    || setweight(to_tsvector('english'::regconfig, COALESCE(
+        (SELECT string_agg(v.material_type, ' ') FROM product_productvariant v
+         WHERE v.product_id = p.id AND NOT v.is_deleted), '')), 'B')
+    || setweight(to_tsvector('english'::regconfig, COALESCE(
+        (SELECT string_agg(v.description, ' ') FROM product_productvariant v
+         WHERE v.product_id = p.id AND NOT v.is_deleted), '')), 'C');
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0026_product_primary_image'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTOR, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_rating_summaries(apps, schema_editor):
+    # same counts as RatingSummaryManager.rebuild
+    Product = apps.get_model('product', 'Product')
+    Review = apps.get_model('product', 'Review')
+    ProductRatingSummary = apps.get_model('product', 'ProductRatingSummary')
+
+    stars = {f's{n}': models.Count('id', filter=models.Q(rating=n)) for n in range(1, 6)}
+    stats = {
+        row['product__product_id']: row
+        for row in Review.objects.values('product__product_id')
+        .annotate(count=models.Count('id'), total=models.Sum('rating'), **stars)
+    }
+    summaries = []
+    for pid in Product.objects.values_list('id', flat=True):
+        row = stats.get(pid)
+        count = row['count'] if row else 0
+        total = row['total'] if row else 0
+        summaries.append(ProductRatingSummary(
+            product_id=pid,
+            review_count=count,
+            rating_total=total,
+            average_rating=round(Decimal(total) / count, 2) if count else Decimal(0),
+            **{f'stars_{n}': (row[f's{n}'] if row else 0) for n in range(1, 6)},
+        ))
+    ProductRatingSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0027_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRatingSummary',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='product.product')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_total', models.PositiveIntegerField(default=0)),
+                ('average_rating', models.DecimalField(decimal_places=2, default=0, max_digits=3)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['average_rating'], name='product_pro_average_01d32c_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_rating_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:11
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0032_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantCoPurchaseNeighbours',
+            fields=[
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='co_purchase', serialize=False, to='product.productvariant')),
+                ('neighbour_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('counts', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VariantCoPurchasePair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('variant_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.productvariant')),
+                ('variant_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.productvariant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('variant_a', 'variant_b'), name='unique_variant_co_purchase_pair')],
+            },
+        ),
+    ]
@@ -1,4 +1,9 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models.functions import Cast,Round
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from cloudinary.models import CloudinaryField
 from users.models import User
 from commerce.models import Orders
@@ -85,11 +90,23 @@ class Product(models.Model):
     updated_at =models.DateTimeField(auto_now=True)
     is_active =models.BooleanField(default=True)
     is_deleted =models.BooleanField(default=False)
+    # cheapest live variant after offers, kept current by refresh_effective_prices
+    min_effective_price=models.DecimalField(max_digits=10,decimal_places=2,null=True,blank=True)
+    # cover image, kept current by ProductImage.save / ImageManager.sync_primary
+    primary_image=models.ForeignKey('ProductImage',on_delete=models.SET_NULL,null=True,blank=True,related_name='+')
+    # name, category, variant materials/descriptions; see commerce.utils.search
+    search_vector=SearchVectorField(null=True,editable=False)
 
     objects=ProductManager()
 
     class Meta:
         ordering=['-created_at']
+        indexes = [
+            models.Index(fields=['min_effective_price']),
+            models.Index(fields=['category','min_effective_price']),
+            GinIndex(fields=['search_vector'],name='product_search_gin'),
+            GinIndex(fields=['name'],name='product_name_trgm',opclasses=['gin_trgm_ops']),
+        ]
 
 
     def __str__(self):
@@ -128,12 +145,17 @@ class ProductVariant(models.Model):
     stock=models.IntegerField()
     is_deleted=models.BooleanField(default=False)
     created_at=models.DateTimeField(auto_now_add=True)
+    effective_price=models.DecimalField(max_digits=10,decimal_places=2,null=True,blank=True)
+    effective_offer_percent=models.PositiveIntegerField(default=0)
 
 
     objects=VariantManager()
 
     class Meta:
         ordering=['id']
+        indexes = [
+            models.Index(fields=['product','effective_price']),
+        ]
 
     def __str__(self):
         return self.material_type
@@ -161,6 +183,17 @@ class ImageManager(models.Manager):
             i.save(update_fields=['is_deleted'])
             return i
         return None
+
+    def sync_primary(self,product_id):
+        """
+        Points Product.primary_image at the product's live primary image,
+        falling back to its newest live image (or None).
+        """
+        image=self.get_queryset().filter(product_id=product_id).order_by('-is_primary','-id').first()
+        Product.objects.all_with_deleted().filter(id=product_id).update(
+            primary_image=image,updated_at=timezone.now()
+        )
+        return image
     
 
 class ProductImage(models.Model):
@@ -188,6 +221,8 @@ class ProductImage(models.Model):
                 self.is_primary = True
 
         super().save(*args, **kwargs)
+        # soft_delete/restore go through here too
+        ProductImage.objects.sync_primary(self.product_id)
     
 class Coupon(models.Model):
     DISCOUNT_CHOICES=[
@@ -327,8 +362,227 @@ class Review(models.Model):
                 name='unique_review_per_user_per_product'
             )
         ]
+        indexes = [
+            models.Index(fields=['product', 'created_at']),
+            models.Index(fields=['product', 'rating']),
+        ]
         ordering = ['-created_at']
 
     def __str__(self):
         user = self.user.email if self.user else "Anonymous"
         return f"{user} rated {self.product} ({self.rating}/5)"
+
+
+class RatingSummaryManager(models.Manager):
+
+    def record(self,product_id,rating,delta=1):
+        """
+        Adds (delta=1) or removes (delta=-1) one review of `rating` stars.
+        Counters move with F() so concurrent reviews don't lose updates.
+        A missing row, or a removal that would take a counter below zero,
+        is recounted from the Review table instead.
+        """
+        rows=self.filter(product_id=product_id)
+        if delta<0:
+            rows=rows.filter(review_count__gte=1,rating_total__gte=rating,**{f'stars_{rating}__gte':1})
+        updated=rows.update(**{
+            'review_count':models.F('review_count')+delta,
+            'rating_total':models.F('rating_total')+rating*delta,
+            f'stars_{rating}':models.F(f'stars_{rating}')+delta,
+        })
+        if updated:
+            self._refresh_average(product_id)
+        else:
+            # called from the Review signals, so the table already reflects the change
+            self.rebuild([product_id])
+
+    def _refresh_average(self,product_id):
+        self.filter(product_id=product_id).update(average_rating=models.Case(
+            models.When(review_count=0,then=models.Value(0)),
+            default=Round(
+                Cast('rating_total',models.DecimalField(max_digits=10,decimal_places=2))
+                /models.F('review_count'),
+                2,
+            ),
+            output_field=models.DecimalField(max_digits=3,decimal_places=2),
+        ))
+
+    def rebuild(self,product_ids=None):
+        """Recomputes summaries from the Review table; every product gets a row."""
+        products=Product.objects.all_with_deleted()
+        if product_ids is not None:
+            products=products.filter(id__in=product_ids)
+        product_ids=list(products.values_list('id',flat=True))
+
+        stars={f's{n}':models.Count('id',filter=models.Q(rating=n)) for n in range(1,6)}
+        stats={
+            row['product__product_id']:row
+            for row in Review.objects.filter(product__product_id__in=product_ids)
+            .values('product__product_id')
+            .annotate(count=models.Count('id'),total=models.Sum('rating'),**stars)
+        }
+
+        summaries=[]
+        for pid in product_ids:
+            row=stats.get(pid)
+            count=row['count'] if row else 0
+            total=row['total'] if row else 0
+            summaries.append(self.model(
+                product_id=pid,
+                review_count=count,
+                rating_total=total,
+                average_rating=round(Decimal(total)/count,2) if count else Decimal(0),
+                **{f'stars_{n}':(row[f's{n}'] if row else 0) for n in range(1,6)},
+            ))
+
+        self.bulk_create(
+            summaries,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['review_count','rating_total','average_rating']+[f'stars_{n}' for n in range(1,6)],
+            batch_size=500,
+        )
+        return len(summaries)
+
+
+class ProductRatingSummary(models.Model):
+    product=models.OneToOneField(Product,on_delete=models.CASCADE,primary_key=True,related_name='rating_summary')
+    review_count=models.PositiveIntegerField(default=0)
+    rating_total=models.PositiveIntegerField(default=0)
+    average_rating=models.DecimalField(max_digits=3,decimal_places=2,default=0)
+    stars_1=models.PositiveIntegerField(default=0)
+    stars_2=models.PositiveIntegerField(default=0)
+    stars_3=models.PositiveIntegerField(default=0)
+    stars_4=models.PositiveIntegerField(default=0)
+    stars_5=models.PositiveIntegerField(default=0)
+    updated_at=models.DateTimeField(auto_now=True)
+
+    objects=RatingSummaryManager()
+
+    class Meta:
+        indexes=[
+            models.Index(fields=['average_rating']),
+        ]
+
+    @property
+    def histogram(self):
+        """[(5, count), (4, count), ...] for rating bars."""
+        return [(n,getattr(self,f'stars_{n}')) for n in range(5,0,-1)]
+
+    def __str__(self):
+        return f"{self.product} ({self.average_rating}/5, {self.review_count})"
+
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed top-K "related products" per product, rebuilt by the
+    refresh_related_products command (see commerce.services.recommendations).
+    """
+    product=models.ForeignKey(Product,on_delete=models.CASCADE,related_name='related_entries')
+    related=models.ForeignKey(Product,on_delete=models.CASCADE,related_name='+')
+    score=models.FloatField()
+    rank=models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints=[
+            models.UniqueConstraint(fields=['product','related'],name='unique_related_product'),
+        ]
+        indexes=[
+            models.Index(fields=['product','rank']),
+        ]
+        ordering=['product','rank']
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class CoPurchasePair(models.Model):
+    """
+    One cell of the sparse co-purchase matrix: how many orders delivered
+    both products. Stored once per pair with product_a < product_b.
+    """
+    product_a=models.ForeignKey(Product,on_delete=models.CASCADE,related_name='+')
+    product_b=models.ForeignKey(Product,on_delete=models.CASCADE,related_name='+')
+    count=models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints=[
+            models.UniqueConstraint(fields=['product_a','product_b'],name='unique_co_purchase_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_a_id} + {self.product_b_id} ({self.count})"
+
+
+class CoPurchaseNeighbours(models.Model):
+    """Top-N most co-purchased products of a product, strongest first, read with one pk lookup."""
+    product=models.OneToOneField(Product,on_delete=models.CASCADE,primary_key=True,related_name='co_purchase')
+    neighbour_ids=ArrayField(models.IntegerField(),default=list)
+    counts=ArrayField(models.PositiveIntegerField(),default=list)
+    updated_at=models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id}: {self.neighbour_ids}"
+
+
+class VariantCoPurchasePair(models.Model):
+    """CoPurchasePair for variants: orders that delivered both, variant_a < variant_b."""
+    variant_a=models.ForeignKey(ProductVariant,on_delete=models.CASCADE,related_name='+')
+    variant_b=models.ForeignKey(ProductVariant,on_delete=models.CASCADE,related_name='+')
+    count=models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints=[
+            models.UniqueConstraint(fields=['variant_a','variant_b'],name='unique_variant_co_purchase_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.variant_a_id} + {self.variant_b_id} ({self.count})"
+
+
+class VariantCoPurchaseNeighbours(models.Model):
+    """Top-N most co-purchased variants of a variant, strongest first."""
+    variant=models.OneToOneField(ProductVariant,on_delete=models.CASCADE,primary_key=True,related_name='co_purchase')
+    neighbour_ids=ArrayField(models.IntegerField(),default=list)
+    counts=ArrayField(models.PositiveIntegerField(),default=list)
+    updated_at=models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.variant_id}: {self.neighbour_ids}"
+
+
+class CoPurchaseState(models.Model):
+    """Single row: the last order folded into the co-purchase matrix."""
+    last_order_id=models.PositiveBigIntegerField(default=0)
+    updated_at=models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"co-purchase index at order {self.last_order_id}"
+
+
+class StockMovement(models.Model):
+    """
+    Append-only inventory ledger, one row per stock change. Movements
+    with compacted=False are not folded into ProductVariant.stock yet
+    (INVENTORY_LEDGER mode); current stock is the snapshot plus their sum.
+    """
+    REASON_CHOICES=[
+        ('sale','Sale'),
+        ('cancel','Cancellation'),
+        ('return','Return'),
+        ('admin_adjust','Admin adjustment'),
+    ]
+    variant=models.ForeignKey(ProductVariant,on_delete=models.CASCADE,related_name='stock_movements')
+    delta=models.IntegerField()
+    reason=models.CharField(max_length=20,choices=REASON_CHOICES)
+    order=models.ForeignKey(Orders,on_delete=models.SET_NULL,null=True,blank=True,related_name='stock_movements')
+    compacted=models.BooleanField(default=False)
+    created_at=models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes=[
+            models.Index(fields=['variant'],condition=models.Q(compacted=False),name='stockmovement_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.variant_id} {self.delta:+d} ({self.reason})"
@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from product.models import Category, Product, ProductVariant, ProductImage, ProductOffer, CategoryOffer, Review, ProductRatingSummary
+from commerce.utils.offer_cache import invalidate_offer_cache
+from commerce.utils.pricing import refresh_effective_prices
+from commerce.utils.search import refresh_search_vectors
+from commerce.utils.facets import invalidate_facets
+
+PRICE_FIELDS = {"sales_price", "regular_price", "is_deleted"}
+SEARCH_FIELDS = {"name", "category", "material_type", "description", "is_deleted"}
+
+
+def _refresh_on_commit(product_ids):
+    product_ids = list(product_ids)
+    if product_ids:
+        transaction.on_commit(lambda: refresh_effective_prices(product_ids))
+
+
+def _reindex_on_commit(product_ids):
+    product_ids = list(product_ids)
+    if product_ids:
+        transaction.on_commit(lambda: refresh_search_vectors(product_ids))
+
+
+@receiver(post_save, sender=ProductOffer)
+@receiver(post_delete, sender=ProductOffer)
+@receiver(post_save, sender=CategoryOffer)
+@receiver(post_delete, sender=CategoryOffer)
+def offer_changed(sender, instance, **kwargs):
+    invalidate_offer_cache()
+
+    if sender is ProductOffer:
+        _refresh_on_commit([instance.product_id])
+    else:
+        _refresh_on_commit(
+            Product.objects.all_with_deleted()
+            .filter(category_id=instance.category_id)
+            .values_list("id", flat=True)
+        )
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_changed(sender, instance, update_fields=None, **kwargs):
+    # stock-only saves happen on every order and don't move the price
+    if update_fields and not PRICE_FIELDS.intersection(update_fields):
+        return
+    _refresh_on_commit([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductImage)
+def image_deleted(sender, instance, **kwargs):
+    # saves (incl. soft delete/restore) resync in ProductImage.save
+    ProductImage.objects.sync_primary(instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    _reindex_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_text_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    _reindex_on_commit([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and "name" not in update_fields):
+        return
+    _reindex_on_commit(
+        Product.objects.all_with_deleted()
+        .filter(category_id=instance.pk)
+        .values_list("id", flat=True)
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def catalog_changed(sender, instance, update_fields=None, **kwargs):
+    # price changes reach the facets through refresh_effective_prices
+    if update_fields and set(update_fields) <= {"stock"}:
+        return
+    invalidate_facets()
+
+
+def _review_product_id(review):
+    if Review.product.is_cached(review):
+        return review.product.product_id
+    return (
+        ProductVariant.objects.all_with_deleted()
+        .filter(id=review.product_id)
+        .values_list("product_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    product_id = _review_product_id(instance)
+    if product_id is None:
+        return
+    if created:
+        ProductRatingSummary.objects.record(product_id, instance.rating)
+    else:
+        # edits can change the rating, recount this product
+        ProductRatingSummary.objects.rebuild([product_id])
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    product_id = _review_product_id(instance)
+    if product_id is not None:
+        ProductRatingSummary.objects.record(product_id, instance.rating, delta=-1)
@@ -1,3 +1,197 @@
+from contextlib import contextmanager
+from decimal import Decimal
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from commerce.utils.keyset import LISTING_SORTS, keyset_paginate
+from commerce.utils.pricing import refresh_effective_prices
+from commerce.utils.search import refresh_search_vectors, search_products
+from product import views
+from product.models import Category, Product, ProductRatingSummary, ProductVariant, Review
+from users.models import User
 
-# Create your tests here.
+
+# TestCase turns every atomic block into savepoints; outside tests the
+# outermost block runs none, so they don't count against a budget
+SAVEPOINT_STATEMENTS = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Like assertNumQueries, but fails only when more than `limit` queries run."""
+    with CaptureQueriesContext(connection) as captured:
+        yield captured
+    queries = [q["sql"] for q in captured.captured_queries if not q["sql"].startswith(SAVEPOINT_STATEMENTS)]
+    if len(queries) > limit:
+        statements = "\n".join(f"{i}. {sql}" for i, sql in enumerate(queries, start=1))
+        raise AssertionError(f"{len(queries)} queries executed, {limit} allowed:\n{statements}")
+
+
+class QueryBudgetTests(TestCase):
+    """Each @query_budget view stays within its budget once the caches are warm."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="budget@example.com", password="pass", first_name="Query", last_name="Budget"
+        )
+        cls.category = Category.objects.create(name="Chairs", image="categories/chairs.jpg")
+        for i in range(3):
+            cls.product = Product.objects.create(name=f"Teak chair {i}", category=cls.category)
+            ProductVariant.objects.create(
+                product=cls.product,
+                material_type="Teak",
+                regular_price=Decimal("1200.00"),
+                sales_price=Decimal("1000.00"),
+                description="Solid teak dining chair",
+                stock=5,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertWithinBudget(self, view, url, headers=None):
+        self.client.get(url, headers=headers)  # warm the caches
+        with assert_max_queries(view.query_budget):
+            response = self.client.get(url, headers=headers)
+        return response
+
+    def test_products(self):
+        response = self.assertWithinBudget(views.products, reverse("products"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_products_search(self):
+        response = self.assertWithinBudget(views.products, reverse("products") + "?search=teak")
+        self.assertEqual(response.status_code, 200)
+
+    def test_category_products(self):
+        response = self.assertWithinBudget(
+            views.category_products, reverse("category_products", args=[self.category.id])
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_variants(self):
+        url = reverse("product_variants", args=[self.product.id])
+        response = self.assertWithinBudget(views.product_variants, url)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.assertWithinBudget(views.product_variants, url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking the cursors visits every row once, in the full ordering."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Chairs", image="categories/chairs.jpg")
+        woods = ["Teak", "Teak teak", "Pine", "Teak teak teak", "Oak"]
+        for i in range(15):
+            product = Product.objects.create(name=f"Chair {i:02}", category=category)
+            ProductVariant.objects.create(
+                product=product,
+                material_type=woods[i % 5],
+                regular_price=Decimal("1500.00"),
+                # three price ties per step
+                sales_price=Decimal(1000 + 100 * (i // 3)),
+                description=f"{woods[i % 5]} dining chair",
+                stock=5,
+            )
+        # on_commit doesn't run in setUpTestData
+        refresh_effective_prices()
+        refresh_search_vectors()
+        Product.objects.filter(variants__material_type="Oak").update(min_effective_price=None)
+
+    def listing(self):
+        return Product.objects.annotate(final_min_price=F("min_effective_price"))
+
+    def walk(self, queryset, sort, per_page=4):
+        seen, cursor = [], None
+        for _ in range(queryset.count() + 1):
+            page = keyset_paginate(queryset, sort=sort, cursor=cursor, per_page=per_page, with_count=False)
+            seen += [product.id for product in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+        self.fail(f"the cursors never reached the end: {seen}")
+
+    def test_listing_sorts(self):
+        for sort in [None, *LISTING_SORTS]:
+            if sort == "relevance":
+                continue
+            with self.subTest(sort=sort):
+                field, descending = LISTING_SORTS.get(sort, ("id", False))
+                order = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+                expected = list(
+                    self.listing().order_by(order, "-id" if descending else "id").values_list("id", flat=True)
+                )
+                self.assertEqual(self.walk(self.listing(), sort), expected)
+
+    def test_relevance_keyed_on_the_float_rank(self):
+        results = search_products(self.listing(), "teak")
+        ranks = list(results.order_by("-search_rank", "-id").values_list("id", "search_rank"))
+        self.assertGreater(len(ranks), 4)
+        self.assertGreater(len({rank for _, rank in ranks}), 1)
+        self.assertLess(len({rank for _, rank in ranks}), len(ranks))  # ties, split across pages
+
+        for per_page in (1, 2, 4):
+            with self.subTest(per_page=per_page):
+                self.assertEqual(self.walk(results, "relevance", per_page), [pid for pid, _ in ranks])
+
+
+class RatingSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Chairs", image="categories/chairs.jpg")
+        cls.rated, cls.unrated = (
+            Product.objects.create(name=name, category=category) for name in ("Rated chair", "New chair")
+        )
+        cls.teak, cls.pine = (
+            ProductVariant.objects.create(
+                product=cls.rated, material_type=wood, regular_price=Decimal("1200.00"),
+                sales_price=Decimal("1000.00"), description=f"{wood} chair", stock=5,
+            )
+            for wood in ("Teak", "Pine")
+        )
+        cls.users = [User.objects.create_user(email=f"reviewer{i}@example.com", password="pass") for i in range(3)]
+
+    def review(self, user, variant, rating):
+        return Review.objects.create(user=user, product=variant, rating=rating, comment="Sturdy")
+
+    def summary(self, product):
+        return ProductRatingSummary.objects.filter(product=product).values(
+            "review_count", "rating_total", "average_rating", *(f"stars_{n}" for n in range(1, 6))
+        ).get()
+
+    def test_signals_match_a_rebuild(self):
+        self.review(self.users[0], self.teak, 5)
+        self.review(self.users[1], self.pine, 4)
+        edited = self.review(self.users[2], self.teak, 2)
+        edited.rating = 1
+        edited.save()
+        self.review(self.users[2], self.pine, 3).delete()
+
+        live = self.summary(self.rated)
+        self.assertEqual(live["review_count"], 3)
+        self.assertEqual(live["average_rating"], Decimal("3.33"))
+
+        ProductRatingSummary.objects.all().delete()
+        self.assertEqual(ProductRatingSummary.objects.rebuild(), Product.objects.all_with_deleted().count())
+        self.assertEqual(self.summary(self.rated), live)
+
+    def test_rebuild_gives_unreviewed_products_a_zero_row(self):
+        ProductRatingSummary.objects.rebuild([self.unrated.id])
+
+        summary = self.summary(self.unrated)
+        self.assertEqual((summary["review_count"], summary["average_rating"]), (0, Decimal("0")))
+
+    def test_rebuild_repairs_drifted_counters(self):
+        self.review(self.users[0], self.teak, 4)
+        ProductRatingSummary.objects.filter(product=self.rated).update(review_count=9, stars_4=0)
+
+        ProductRatingSummary.objects.rebuild([self.rated.id])
+
+        summary = self.summary(self.rated)
+        self.assertEqual((summary["review_count"], summary["stars_4"]), (1, 1))
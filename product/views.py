@@ -1,25 +1,43 @@
 from django.utils import timezone
 import logging
 from django.db import IntegrityError
-from django.db.models import Avg,Count
 from django.shortcuts import render, redirect,HttpResponse,get_object_or_404
 from product.forms import ReviewForm
-from product.models import Category,Product,ProductImage,ProductVariant, Review
-from django.db.models import OuterRef, Subquery,Prefetch,Q,Min,Case,When,F,Value,DecimalField
-from django.db.models.functions import Greatest, Least, Coalesce
-from django.core.paginator import Paginator
+from product.models import Category,Product,ProductVariant, Review
+from django.db.models import Prefetch,Q,F,Exists,OuterRef
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import never_cache
+from django.views.decorators.cache import never_cache,cache_control
+from django.views.decorators.http import condition
+from django.http import JsonResponse
 from users.models import User
 from django.core.cache import cache
-from commerce.models import OrderItem, Wishlist, WishlistItem
+from commerce.models import OrderItem, Wishlist
 import json
 from users.decorators import block_check
-from commerce.utils.pricing import get_pricing_context,attach_best_pricing_to_products
+from commerce.utils.pricing import get_pricing_context,get_pricing_contexts,attach_best_pricing_to_products
+from commerce.utils.image_urls import warm_primary_images
+from commerce.utils.card_cache import attach_card_html
+from commerce.utils.search import search_products
+from commerce.utils.facets import facet_counts,PRICE_BUCKETS,RATING_BANDS
+from commerce.utils.keyset import keyset_paginate,LISTING_SORTS
+from commerce.utils.query_budget import query_budget
+from commerce.utils.wishlist_ids import get_wishlist_ids
+from commerce.services.inventory import attach_live_stock
+from commerce.services.recommendations import get_related_products,get_also_bought
+from commerce.services.product_detail import ProductDetail,variant_payload,variants_etag
 
 logger = logging.getLogger('product')
 
+
+def _has_variants():
+    # EXISTS instead of joining variants, so listings need no DISTINCT
+    return Exists(ProductVariant.objects.filter(product=OuterRef('pk')))
+
+
+# session, user, category, page rows, variants; the count, wishlist ids,
+# offers, images and card HTML come from the cache once warm
+@query_budget(7)
 @block_check
 @login_required
 def category_products(request, id):
@@ -31,34 +49,31 @@ def category_products(request, id):
         "category_id": id
     }
     )
-    products = Product.objects.filter(category=category,variants__isnull=False).annotate(
-        average_rating=Avg('variants__reviews__rating'),
-        review_count=Count('variants__reviews', distinct=True) 
-    ).prefetch_related(
+    products = Product.objects.filter(category=category).filter(_has_variants()).annotate(
+        # one-to-one join, maintained by the Review signals
+        average_rating=F('rating_summary__average_rating'),
+        review_count=F('rating_summary__review_count'),
+    ).select_related('primary_image').prefetch_related(
         Prefetch(
             'variants',
             queryset=ProductVariant.objects
                 .select_related('product__category')
-                .prefetch_related(
-                    'product__product_offers',
-                    'product__category__category_offers'
-                )
                 .order_by('id')
-        ),
-        Prefetch(
-            'images',
-            queryset=ProductImage.objects.order_by('-is_primary', 'id')
         )
-    ).distinct()
+    )
+    cursor = request.GET.get('cursor')
+    page = keyset_paginate(products, cursor=cursor, per_page=12)
     logger.info(
     "Products fetched for category",
     extra={
         "category_id": id,
-        "product_count": products.count()
+        "product_count": page.total_count
     }
     )
     try:
-        attach_best_pricing_to_products(products)
+        attach_best_pricing_to_products(page.object_list)
+        warm_primary_images(page.object_list)
+        attach_card_html(page.object_list)
     except Exception:
         logger.error(
             "Failed to attach pricing for category products",
@@ -67,92 +82,63 @@ def category_products(request, id):
         )
 
 
-    wishlist_product_ids = []
-
-    if request.user.is_authenticated:
-        wishlist_product_ids = list(
-            WishlistItem.objects.filter(
-                wishlist__user=request.user,
-                product__product__in=products
-            ).values_list(
-                'product_id',
-                flat=True
-            )
-        )
+    wishlist_product_ids = get_wishlist_ids(request.user.id)
 
     context = {
-        'products': products,
+        'page': page,
+        'products': page.object_list,
         'category': category,
         'wishlist_product_ids': wishlist_product_ids,
+        'querystring': '',
     }
 
+    if request.headers.get("HX-Request") and cursor:
+        return render(request, 'product/components/product_page.html', context)
     return render(request, 'product/category_products.html', context)
 
+# session, user, page rows, variants, categories; a search adds the
+# ranked query and its facet ids. Count, facet table, wishlist ids,
+# offers, images and card HTML come from the cache once warm
+@query_budget(9)
 @block_check
 @never_cache
 @login_required(login_url="/login")
 def products(request):    
-    now = timezone.now()
-    best_price_subquery = ProductVariant.objects.filter(
-        product=OuterRef('pk'),
-        is_deleted=False
-    ).annotate(
-        p_disc=Case(
-            When(product__product_offers__is_active=True,
-                 product__product_offers__start_date__lte=now,
-                 product__product_offers__end_date__gte=now,
-                 then=Least(
-                     F('sales_price') * F('product__product_offers__discount_percent') / 100,
-                     Coalesce(F('product__product_offers__max_discount_amount'), Value(999999))
-                 )),
-            default=Value(0),
-            output_field=DecimalField()
-        ),
-        c_disc=Case(
-            When(product__category__category_offers__is_active=True,
-                 product__category__category_offers__start_date__lte=now,
-                 product__category__category_offers__end_date__gte=now,
-                 then=Least(
-                     F('sales_price') * F('product__category__category_offers__discount_percent') / 100,
-                     Coalesce(F('product__category__category_offers__max_discount_amount'), Value(999999))
-                 )),
-            default=Value(0),
-            output_field=DecimalField()
-        )
-    ).annotate(
-        discounted_price=F('sales_price') - Greatest(F('p_disc'), F('c_disc'))
-    ).order_by('discounted_price').values('discounted_price')[:1]
-
     #  THE MAIN QUERY ---
     products = Product.objects.filter(
+        _has_variants(),
         category__is_deleted=False,
-        variants__isnull=False
     ).annotate(
-        # Attach the single result from the subquery
-        final_min_price=Subquery(best_price_subquery, output_field=DecimalField()),
-        average_rating=Avg('variants__reviews__rating'),
-        review_count=Count('variants__reviews', distinct=True) 
-    ).prefetch_related(
-        Prefetch('images', queryset=ProductImage.objects.order_by('id')),
+        # materialized by refresh_effective_prices, see Product.min_effective_price
+        final_min_price=F('min_effective_price'),
+        # one-to-one join, maintained by the Review signals
+        average_rating=F('rating_summary__average_rating'),
+        review_count=F('rating_summary__review_count'),
+    ).select_related('primary_image').prefetch_related(
         Prefetch('variants', queryset=ProductVariant.objects
-            .select_related('product__category')
-            .prefetch_related(
-                'product__product_offers',
-                'product__category__category_offers'
-            ))
-    ).distinct()
+            .select_related('product__category'))
+    )
     search_query = request.GET.get('search')
 
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(category__name__icontains=search_query) |
-            Q(variants__material_type__icontains=search_query)
-        )
+        products = search_products(products, search_query)
+    # facet counts cover the search results, not the sidebar selections
+    facet_product_ids = products.values_list('id', flat=True) if search_query else None
 
-    category_ids = request.GET.getlist('category')
+    category_ids = [c for c in request.GET.getlist('category') if c.isdigit()]
     if category_ids:
         products = products.filter(category_id__in=category_ids)
+
+    selected_materials = request.GET.getlist('material')
+    if selected_materials:
+        products = products.filter(
+            id__in=ProductVariant.objects.filter(material_type__in=selected_materials).values('product_id')
+        )
+
+    min_rating = request.GET.get('rating')
+    min_rating = int(min_rating) if min_rating and min_rating.isdigit() else None
+    if min_rating:
+        products = products.filter(average_rating__gte=min_rating)
     # filtering
     price_min = request.GET.get('price_min')
     price_max = request.GET.get('price_max')
@@ -171,28 +157,12 @@ def products(request):
             low, high = pr.split('-')
             price_query |= Q(final_min_price__gte=low, final_min_price__lte=high)
         products = products.filter(price_query)
-    # sorting
+    # sorting, applied by keyset_paginate
     sort = request.GET.get('sort')
-    if sort == 'low_to_high':
-        products = products.order_by('final_min_price')
-    elif sort == 'high_to_low':
-        products = products.order_by('-final_min_price')
-    elif sort == 'a_to_z':
-        products = products.order_by('name')
-    elif sort == 'z_to_a':
-        products = products.order_by('-name')
-    elif sort == 'new':
-        products = products.order_by('-created_at')
-    else:
-        products = products.order_by('id')
-
-    wishlist_variant_ids = []
-    if request.user.is_authenticated:
-        wishlist_variant_ids = list(
-            WishlistItem.objects.filter(
-                wishlist__user=request.user
-            ).values_list("product_id", flat=True)
-        )
+    if sort not in LISTING_SORTS or (sort == 'relevance' and not search_query):
+        sort = 'relevance' if search_query else None
+
+    wishlist_variant_ids = get_wishlist_ids(request.user.id)
     logger.info(
     "Product listing accessed",
     extra={
@@ -202,13 +172,13 @@ def products(request):
         "sort": sort
     }
     )
-    paginator = Paginator(products, 8)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
+    cursor = request.GET.get('cursor')
+    page = keyset_paginate(products, sort=sort, cursor=cursor, per_page=8)
 
     try:
-        attach_best_pricing_to_products(page_obj.object_list)
+        attach_best_pricing_to_products(page.object_list)
+        warm_primary_images(page.object_list)
+        attach_card_html(page.object_list)
     except Exception:
         logger.error(
             "Pricing injection failed on product list",
@@ -216,40 +186,60 @@ def products(request):
         )
 
     params = request.GET.copy()
-    if "page" in params:
-        params.pop("page")
+    for key in ("page", "cursor"):
+        params.pop(key, None)
     querystring = params.urlencode()
 
+    logger.info(
+    "Product pagination",
+    extra={
+        "cursor": cursor,
+        "total_products": page.total_count
+    }
+    )
+    if request.headers.get("HX-Request") and cursor:
+        # infinite scroll: just the next cards and the next sentinel
+        return render(request, "product/components/product_page.html", {
+            "page": page,
+            "products": page.object_list,
+            "wishlist_product_ids": wishlist_variant_ids,
+            "querystring": querystring,
+        })
+
+    facets = facet_counts(
+        categories=category_ids,
+        price_ranges=selected_price_ranges,
+        materials=selected_materials,
+        min_rating=min_rating,
+        product_ids=facet_product_ids,
+    )
+    categories = list(Category.objects.all())
+    for cat in categories:
+        cat.facet_count = facets["categories"].get(cat.id, 0)
+
     context = {
-        "page_obj": page_obj,
-        "products": page_obj.object_list,
+        "page": page,
+        "products": page.object_list,
         "wishlist_product_ids": wishlist_variant_ids,
-        "categories": Category.objects.all(),
+        "categories": categories,
         "price_options": [
-            ("0-4999", "₹0 – ₹4,999"),
-            ("5000-24999", "₹5,000 – ₹24,999"),
-            ("25000-49999", "₹25,000 – ₹49,999"),
-            ("50000-99999", "₹50,000 – ₹99,999"),
-            ("100000-9999999", "₹100,000+"),
+            (pr, label, facets["price"].get(pr, 0)) for pr, label in PRICE_BUCKETS
+        ],
+        "material_options": facets["materials"],
+        "rating_options": [
+            (band, label, facets["rating"].get(band, 0)) for band, label in RATING_BANDS
         ],
         "selected_price_ranges": selected_price_ranges,
+        "selected_materials": selected_materials,
+        "selected_rating": min_rating,
         "search": search_query,
         "querystring": querystring,
     }
-    logger.info(
-    "Product pagination",
-    extra={
-        "page": page_number,
-        "total_products": paginator.count
-    }
-    )
     if request.headers.get("HX-Request"):
         logger.info(
             "HTMX product list request",
             extra={"user_id": request.user.id}
         )
-
-    if request.headers.get("HX-Request"):
         return render(
             request,
             "product/components/product_list_partial.html",
@@ -271,70 +261,89 @@ def product_details(request,id):
     }
     )
     try:
-        product=Product.objects.select_related('category').prefetch_related(
-            Prefetch('images',queryset=ProductImage.objects.order_by('-is_primary','id')),
-            'variants',
-            'variants__product__product_offers',
-            'variants__product__category__category_offers',
-        ).get(id=id)
+        detail=ProductDetail.load(id,request.user)
     except Product.DoesNotExist:
         messages.error(request, "This product is temporarily unavailable!")
         return redirect("products")
-    
-    related_products=Product.objects.filter(category=product.category).exclude(id=id).prefetch_related(
-        Prefetch('images',queryset=ProductImage.objects.order_by('-is_primary','id')),
-        'variants',
-        'variants__product__product_offers',
-        'variants__product__category__category_offers',
-    )
-    if related_products:
-        related_products = list(related_products)
-        attach_best_pricing_to_products(related_products)
-    is_in_wishlist = False
-    wishlist_variant_ids=[]
-    if request.user.is_authenticated:
-        logger.debug(
-            "Wishlist status checked",
-            extra={
-                "user_id": request.user.id,
-                "product_id": id,
-                "in_wishlist": is_in_wishlist
-            }
+    product=detail.product
+    if not detail.variants:
+        logger.warning(
+            "Product has no variants",
+            extra={"product_id": id}
         )
-        variants=list(product.variants.all())
-        default_variant = variants[0] if variants else None
-        pricing=get_pricing_context(default_variant) if default_variant else None
-        wishlist_variant_ids = list(
-            WishlistItem.objects.filter(
-                wishlist__user=request.user
-            ).values_list("product_id", flat=True)
-        )
-        if not product.variants.exists():
-            logger.warning(
-                "Product has no variants",
-                extra={"product_id": id}
-            )
-
-        if default_variant:
-            is_in_wishlist = WishlistItem.objects.filter(
-                wishlist__user=request.user,
-                product=default_variant 
-            ).exists()
-    
-        reviews=Review.objects.filter(product__product=product).select_related("user","product").order_by("-created_at")
-        avg_rating=reviews.aggregate(avg=Avg("rating"))["avg"] or 0
-        avg_rating = round(avg_rating)
+
+    related_products=get_related_products(product)
+    also_bought=get_also_bought([product.id],exclude=[p.id for p in related_products])
+
+    review_page=_review_page(product.id)
+    summary=getattr(product,'rating_summary',None)
+    avg_rating = round(summary.average_rating) if summary else 0
+    default_variant=detail.default_variant
     return render(request,'product/product_details.html',{'product':product,
+                                        'detail':detail,
+                                        'variants':detail.variants,
+                                        'variant_data':detail.variant_data(),
                                         'related_products':related_products,
-                                        'is_in_wishlist': is_in_wishlist,
-                                        'pricing':pricing,
-                                        'wishlist_variant_ids': wishlist_variant_ids,
+                                        'also_bought':also_bought,
+                                        'is_in_wishlist': detail.is_in_wishlist,
+                                        'pricing':detail.pricing,
+                                        'wishlist_variant_ids': detail.wishlist_variant_ids,
                                         'default_variant': default_variant,
                                         'default_variant_id': default_variant.id if default_variant else None,
-                                        'reviews':reviews,
+                                        'reviews':review_page.object_list,
+                                        'review_page':review_page,
+                                        'review_sort':'newest',
+                                        'review_sort_options':REVIEW_SORT_OPTIONS,
+                                        'rating_summary':summary,
                                         "avg_rating": avg_rating,
     })
 
+
+REVIEW_SORTS = {
+    "newest": ("created_at", True),
+    "highest": ("rating", True),
+    "lowest": ("rating", False),
+}
+REVIEW_SORT_OPTIONS = [
+    ("newest", "Newest"),
+    ("highest", "Highest rated"),
+    ("lowest", "Lowest rated"),
+    ("photos", "With photos"),
+]
+REVIEWS_PER_PAGE = 5
+
+
+def _review_page(product_id, sort="newest", cursor=None):
+    reviews = Review.objects.filter(product__product_id=product_id).select_related("user")
+    if sort == "photos":
+        reviews = reviews.exclude(image__isnull=True).exclude(image="")
+    return keyset_paginate(
+        reviews,
+        sort=sort,
+        cursor=cursor,
+        per_page=REVIEWS_PER_PAGE,
+        sorts=REVIEW_SORTS,
+        default=REVIEW_SORTS["newest"],
+        with_count=False,
+    )
+
+
+@block_check
+@login_required(login_url='/login')
+def product_reviews(request, id):
+    sort = request.GET.get("sort", "newest")
+    if sort not in REVIEW_SORTS and sort != "photos":
+        sort = "newest"
+    cursor = request.GET.get("cursor")
+    page = _review_page(id, sort, cursor)
+    return render(request, "product/reviews/review_page.html", {
+        "reviews": page.object_list,
+        "review_page": page,
+        "review_sort": sort,
+        "product_id": id,
+        "cursor": cursor,
+    })
+
 @block_check
 def load_product_image(request, id):
     src = request.GET.get("src")
@@ -357,6 +366,7 @@ def load_variant_info(request, variant_id):
     }
     )
     v = ProductVariant.objects.get(id=variant_id)
+    attach_live_stock([v])
     try:
         pricing = get_pricing_context(v)
     except Exception:
@@ -366,13 +376,7 @@ def load_variant_info(request, variant_id):
             extra={"variant_id": variant_id}
         )
 
-    is_in_wishlist = False
-    
-    if request.user.is_authenticated:
-        is_in_wishlist = WishlistItem.objects.filter(
-            wishlist__user=request.user, 
-            product=v
-        ).exists()
+    is_in_wishlist = v.id in get_wishlist_ids(request.user.id)
 
     context = {
         'variant': v,
@@ -381,6 +385,35 @@ def load_variant_info(request, variant_id):
     }
     return render(request, 'product/components/variant_info.html', context)
 
+VARIANT_INFO_MAX_AGE = 60
+
+
+def _variants_etag(request, id):
+    return variants_etag(id)
+
+
+# session, user and ETag rows on every request; the product and variants
+# only on a miss (offers come from the cache)
+@query_budget(5)
+@block_check
+@login_required
+@cache_control(private=True, max_age=VARIANT_INFO_MAX_AGE)
+@condition(etag_func=_variants_etag)
+def product_variants(request, id):
+    """
+    Price, offer and stock band of every variant of a product as JSON.
+    Carries a strong ETag from variants_etag, so a repeat request is a
+    304 after one small query.
+    """
+    product = get_object_or_404(Product, id=id)
+    variants = list(ProductVariant.objects.filter(product=product).select_related('product__category'))
+    attach_live_stock(variants)
+    pricing_map = get_pricing_contexts(variants)
+    return JsonResponse({
+        "product": product.id,
+        "variants": {v.id: variant_payload(v, pricing_map[v.id]) for v in variants},
+    })
+
 @login_required
 @never_cache
 def add_review(request, variant_id):